@@ -5,7 +5,12 @@ from osgeo import gdal
 import affine
 import fiona
 import collections
+import contextlib
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from rasterio.features import shapes
+import shapely
 from shapely import geometry
 from skimage import measure
 from skimage import filters
@@ -70,6 +75,79 @@ def tasseled_cap(sensor_data, tc_bands=['greenness', 'brightness', 'wetness'],
     return output_array
 
 
+# Tasseled cap coefficients (Crist and Cicone 1985) in the band order of `_TC_BANDS`
+_TC_BANDS = ['blue', 'green', 'red', 'nir', 'swir1', 'swir2']
+_TC_COEFFICIENTS = {'brightness': [0.2043, 0.4158, 0.5524, 0.5741, 0.3124, 0.2303],
+                    'greenness': [-0.1603, -0.2819, -0.4934, 0.7940, -0.0002, -0.1446],
+                    'wetness': [0.0315, 0.2021, 0.3102, 0.1594, -0.6806, -0.6109]}
+
+
+def _tasseled_cap_block(*bands, coeffs=None, block_size=2**20):
+
+    """
+    Computes the tasseled cap bands of one block of data as a single (bands x 6) matrix
+    product, working through the block `block_size` pixels at a time in float32.
+    """
+
+    shape = bands[0].shape
+    flat = [np.reshape(band, -1) for band in bands]
+    size = flat[0].size
+    out = np.empty((len(coeffs), size), dtype=np.float32)
+    stack = np.empty((len(flat), min(block_size, size)), dtype=np.float32)
+
+    for start in range(0, size, block_size):
+        end = min(start + block_size, size)
+        for i, band in enumerate(flat):
+            stack[i, :end - start] = band[start:end]
+        np.matmul(coeffs, stack[:, :end - start], out=out[:, start:end])
+
+    return out.reshape((len(coeffs),) + shape)
+
+
+def tasseled_cap_fused(sensor_data, tc_bands=['greenness', 'brightness', 'wetness'],
+                       drop=True, block_size=2**20):
+
+    """
+    A lower-memory equivalent of `tasseled_cap`. Instead of deep copying the input and
+    multiplying the whole dataset once per output band, all requested tasseled cap bands
+    are computed together as one matrix product of the coefficients with the six input
+    bands, block by block and in float32. The input is not copied; with `drop=False` the
+    original bands are shared with the output.
+
+    Dask-backed datasets stay lazy and are computed chunk by chunk.
+
+    :attr sensor_data: input xarray dataset with six Landsat bands
+    :attr tc_bands: list of tasseled cap bands to compute
+    (valid options: 'wetness', 'greenness','brightness')
+    :attr drop: if 'drop = False', return all original Landsat bands
+    :attr block_size: the number of pixels processed at once in each array or chunk
+    :returns: xarray dataset with newly computed tasseled cap bands (as float32)
+    """
+
+    coeffs = np.array([_TC_COEFFICIENTS[tc_band] for tc_band in tc_bands], dtype=np.float32)
+    template = sensor_data[_TC_BANDS[0]]
+    data = [sensor_data[band].data for band in _TC_BANDS]
+
+    if any(hasattr(band, 'dask') for band in data):
+        import dask.array as da
+        data = [da.asarray(band) for band in data]
+        # Give every band the chunks of the first band so blocks line up
+        data = [band.rechunk(data[0].chunks) for band in data]
+        result = da.map_blocks(_tasseled_cap_block, *data, coeffs=coeffs, block_size=block_size,
+                               dtype=np.float32, new_axis=0,
+                               chunks=((len(tc_bands),),) + data[0].chunks)
+    else:
+        result = _tasseled_cap_block(*data, coeffs=coeffs, block_size=block_size)
+
+    tc_arrays = {tc_band: xr.DataArray(result[i], dims=template.dims, coords=template.coords)
+                 for i, tc_band in enumerate(tc_bands)}
+
+    if drop:
+        return xr.Dataset(tc_arrays, attrs=sensor_data.attrs)
+
+    return sensor_data.assign(tc_arrays)
+
+
 def contour_extract(z_values, ds_array, ds_crs, ds_affine, output_shp=None, min_vertices=2,
                     attribute_data=None, attribute_dtypes=None):
 
@@ -248,24 +326,301 @@ def contour_extract(z_values, ds_array, ds_crs, ds_affine, output_shp=None, min_
     else:
         print('None')
 
-        
+
+# Contour array shared with each worker process by `_init_contour_worker`
+_contour_array = None
+
+
+def _init_contour_worker(ds_array):
+    global _contour_array
+    _contour_array = ds_array
+
+
+def _find_contours(z_value):
+    return measure.find_contours(_contour_array, z_value)
+
+
+def _contours_to_geo(contours, ds_affine, min_vertices=2):
+
+    """
+    Converts a list of pixel (row, col) contour arrays into real world xy arrays with
+    a single vectorized affine transform, dropping NA points and short contours.
+    """
+
+    if len(contours) == 0:
+        return []
+
+    # Stack every vertex of every contour and transform them all at once, adding
+    # (0.5 x the pixel size) to x values and subtracting it from y values to give the
+    # centre point of pixels, rather than the top-left corner
+    lengths = [len(i) for i in contours]
+    rows_cols = np.concatenate(contours)
+    a, b, c, d, e, f = ds_affine.a, ds_affine.b, ds_affine.c, ds_affine.d, ds_affine.e, ds_affine.f
+    coords = np.column_stack((a * rows_cols[:, 1] + b * rows_cols[:, 0] + c + 0.5 * a,
+                              d * rows_cols[:, 1] + e * rows_cols[:, 0] + f - 0.5 * a))
+
+    # Drop any xy points that have NA, then drop contours with too few vertices
+    splits = np.cumsum(lengths)[:-1]
+    contours_geo = np.split(coords, splits)
+    valid = np.split(~np.isnan(coords).any(axis=1), splits)
+    contours_nona = [i[v] for i, v in zip(contours_geo, valid)]
+    return [i for i in contours_nona if len(i) >= min_vertices]
+
+
+def contour_extract_parallel(z_values, ds_array, ds_crs, ds_affine, output_shp=None, min_vertices=2,
+                             attribute_data=None, attribute_dtypes=None, processes=None):
+
+    """
+    A batched version of `contour_extract` for extracting many contour levels at once.
+    Contour levels are found in parallel across a pool of worker processes, the affine
+    is applied to all of a level's vertices in one vectorized operation, and features are
+    streamed to the output shapefile as each level completes rather than after all levels
+    are extracted.
+
+    Parameters and outputs match `contour_extract`, with the addition of:
+
+    :param processes:
+        An optional integer giving the number of worker processes. Defaults to None, which
+        uses one process per CPU. A value of 1 extracts contours in the current process.
+
+    :return:
+        A dictionary with contour z-values as the dict key, and a list of xy point arrays as dict values.
+
+    """
+
+    # First test that input array has only two dimensions:
+    if len(ds_array.shape) != 2:
+        print('None')
+        return
+
+    # Obtain affine object from either rasterio/xarray affine or a gdal geotransform:
+    if type(ds_affine) != affine.Affine:
+        ds_affine = affine.Affine.from_gdal(*ds_affine)
+
+    # Only the raw array is sent to the workers, once per worker
+    ds_array = np.asarray(ds_array)
+
+    # If attribute fields are left empty, default to including a single z-value field based on `z_values`
+    if not attribute_data:
+        attribute_data = {'z_value': z_values}
+        attribute_dtypes = {'z_value': 'float:9.2'}
+
+    contours_dict = collections.OrderedDict()
+
+    # The current process holds the contour array when processes == 1; it is released
+    # even if extracting or writing a level fails
+    try:
+        with contextlib.ExitStack() as stack:
+
+            if processes == 1:
+                _init_contour_worker(ds_array)
+                level_contours = map(_find_contours, z_values)
+            else:
+                # multiprocessing.Pool rather than ProcessPoolExecutor, whose initializer needs Python 3.7
+                pool = stack.enter_context(multiprocessing.Pool(processes=processes,
+                                                                initializer=_init_contour_worker,
+                                                                initargs=(ds_array,)))
+                level_contours = pool.imap(_find_contours, z_values)
+
+            output = None
+            if output_shp:
+                print('\nStreaming contour shapefile to {}'.format(output_shp))
+                schema = {'geometry': 'MultiLineString',
+                          'properties': attribute_dtypes}
+                output = stack.enter_context(fiona.open(output_shp, 'w',
+                                                        crs={'init': str(ds_crs), 'no_defs': True},
+                                                        driver='ESRI Shapefile',
+                                                        schema=schema))
+
+            # Levels arrive in the order of `z_values` as soon as each is done
+            for i, (z_value, contours) in enumerate(zip(z_values, level_contours)):
+
+                contours_withdata = _contours_to_geo(contours, ds_affine, min_vertices)
+
+                if len(contours_withdata) == 0:
+                    print('    No data for contour {}; skipping'.format(z_value))
+                    continue
+
+                contours_dict[z_value] = contours_withdata
+
+                if output is not None:
+                    attribute_vals = {field_name: field_vals[i] for field_name, field_vals in attribute_data.items()}
+                    output.write({'properties': attribute_vals,
+                                  'geometry': mapping(MultiLineString(contours_withdata))})
+
+    finally:
+        _init_contour_worker(None)
+
+    # Return dict of contour arrays
+    return contours_dict
+
+
 # Extract vertex coordinates and heights from geopandas
 def contours_to_arrays(gdf, col):
-    
+
+    # Shapely 2 extracts the coordinates of every (multi-part) geometry in one call,
+    # along with the row each coordinate came from
+    if hasattr(shapely, 'get_coordinates'):
+        coords, index = shapely.get_coordinates(np.asarray(gdf.geometry.values), return_index=True)
+
+    else:
+        coords, index = [], []
+        for i, geom in enumerate(gdf.geometry):
+            parts = geom.geoms if hasattr(geom, 'geoms') else [geom]
+            for part in parts:
+                xy = np.asarray(part.coords)[:, :2]
+                coords.append(xy)
+                index.append(np.full(len(xy), i))
+        coords, index = np.concatenate(coords), np.concatenate(index)
+
+    return np.column_stack((coords, gdf[col].values[index]))
+
+
+def _extract_frame(frame_path, frame_array, z_values, ds_affine, min_vertices, attribute_vals):
+
+    """
+    Extracts the contours of one frame and writes them to `frame_path` as an npz file.
+    The file is written under a temporary name and moved into place once complete, so
+    a partially written frame is never mistaken for a finished one when resuming.
+    """
+
+    coords, lengths, contour_z = [], [], []
+    for z_value in z_values:
+        for contour in _contours_to_geo(measure.find_contours(frame_array, z_value),
+                                        ds_affine, min_vertices):
+            coords.append(contour)
+            lengths.append(len(contour))
+            contour_z.append(z_value)
+
+    coords = np.concatenate(coords) if coords else np.empty((0, 2))
+    attributes = {'attr_{}'.format(field_name): np.asarray(value)
+                  for field_name, value in attribute_vals.items()}
+
+    tmp_path = frame_path + '.tmp.npz'
+    np.savez(tmp_path, coords=coords, lengths=np.asarray(lengths, dtype=np.int64),
+             z_values=np.asarray(contour_z, dtype=np.float64), **attributes)
+    os.replace(tmp_path, frame_path)
+    return frame_path
+
+
+def contour_frames(frames, z_values, ds_affine, output_dir, name='frame', frame_labels=None,
+                   min_vertices=2, attribute_data=None, processes=None):
+
+    """
+    Extracts contours for every frame (e.g. time period) of a three-dimensional array in
+    parallel, writing each frame's contour vertices to a compact binary npz file instead of
+    a shapefile. Frames that already have an output file are skipped, so an interrupted
+    run can be resumed by calling this function again with the same arguments.
+
+    Each npz file holds `coords` (an N x 2 array of xy vertices of all contours in the frame),
+    `lengths` (the number of vertices in each contour), `z_values` (the contour value of each
+    contour) and one `attr_<field>` scalar per field in `attribute_data`.
+
+    :param frames:
+        A three-dimensional array with frames along the first axis. This can be a numpy array or
+        an xarray DataArray (e.g. `combined[water_index]` with a `time_period` dimension); frames
+        of a dask-backed DataArray are only computed as they are sent to the workers.
+
+    :param z_values:
+        A list of numeric contour values to extract from each frame.
+
+    :param ds_affine:
+        Either an affine object from a rasterio or xarray object, or a gdal-derived geotransform.
+
+    :param output_dir:
+        The directory to write the frame files to.
+
+    :param name:
+        An optional prefix for the frame file names. Defaults to 'frame'.
+
+    :param frame_labels:
+        An optional list of strings used in the frame file names (e.g. the time range of each
+        frame). Defaults to None, which uses the frame index.
+
+    :param min_vertices:
+        An optional integer giving the minimum number of vertices required for a contour to be
+        extracted. Defaults to 2.
+
+    :param attribute_data:
+        An optional dictionary of lists with one value per frame (e.g. `{'in_perc': [...]}`) that
+        are stored alongside each frame's contours.
+
+    :param processes:
+        An optional integer giving the number of worker processes. Defaults to None, which uses
+        one process per CPU.
+
+    :return:
+        A list of the frame file paths, in frame order.
+
+    """
+
+    # Obtain affine object from either rasterio/xarray affine or a gdal geotransform:
+    if type(ds_affine) != affine.Affine:
+        ds_affine = affine.Affine.from_gdal(*ds_affine)
+
+    if frame_labels is None:
+        frame_labels = [str(i) for i in range(len(frames))]
+    attribute_data = attribute_data or {}
+
+    os.makedirs(output_dir, exist_ok=True)
+    frame_paths = [os.path.join(output_dir, '{}_{}.npz'.format(name, label)) for label in frame_labels]
+    todo = [i for i, frame_path in enumerate(frame_paths) if not os.path.exists(frame_path)]
+    print('Extracting contours for {} of {} frames'.format(len(todo), len(frame_paths)))
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+
+        # Keep a bounded number of frames in flight so only a few are in memory at once
+        max_pending = 2 * (processes or os.cpu_count() or 1)
+        pending = set()
+        for i in todo:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            attribute_vals = {field_name: field_vals[i] for field_name, field_vals in attribute_data.items()}
+            pending.add(pool.submit(_extract_frame, frame_paths[i], np.asarray(frames[i]), z_values,
+                                    ds_affine, min_vertices, attribute_vals))
+        for future in pending:
+            future.result()
+
+    return frame_paths
+
+
+def frames_to_arrays(frame_paths, col=None):
+
+    """
+    Loads frame files written by `contour_frames` into a single array of x, y and value
+    columns, matching the output of `contours_to_arrays` for the equivalent shapefiles.
+
+    :param frame_paths:
+        A list of frame file paths.
+
+    :param col:
+        An optional attribute field to use as the value of each vertex. Defaults to None,
+        which uses the contour z-value.
+
+    :return:
+        An N x 3 array of x, y and value columns, with no rows if `frame_paths` is empty
+        (e.g. when no time slices produced contours).
+
+    """
+
+    if len(frame_paths) == 0:
+        return np.empty((0, 3))
+
     coords_zvals = []
-    
-    for i in range(len(gdf)):
-        
-        val = gdf.iloc[i][col]
-    
-        try:
-            coords = np.concatenate([np.vstack(x.coords.xy).T for x in gdf.iloc[i].geometry])
-            
-        except:
-            coords = np.vstack(gdf.iloc[i].geometry.coords.xy).T
 
-        coords_zvals.append(np.column_stack((coords, np.full(np.shape(coords)[0], fill_value=val))))
-    
+    for frame_path in frame_paths:
+
+        with np.load(frame_path) as frame:
+            coords = frame['coords']
+            if col is None:
+                vals = np.repeat(frame['z_values'], frame['lengths'])
+            else:
+                vals = np.full(len(coords), fill_value=frame['attr_{}'.format(col)])
+
+        coords_zvals.append(np.column_stack((coords, vals)))
+
     return np.concatenate(coords_zvals)
 
 
@@ -304,4 +659,113 @@ def interpolate_timeseries(ds, freq='7D', method='linear'):
     
     # Use these dates to linearly interpolate new data for each new date
     print('Interpolating {} time-steps at {} intervals'.format(len(from_to), freq))
-    return ds.interp(coords={'time': from_to}, method=method)
\ No newline at end of file
+    return ds.interp(coords={'time': from_to}, method=method)
+
+def _interp_table(src_times, dst_times, method='linear'):
+
+    """
+    Precomputes, for each destination time, the indices of the source times on either
+    side of it and the weight given to the later of the two. Destination times outside
+    the source times are flagged as invalid.
+    """
+
+    src = src_times.astype('datetime64[ns]').astype(np.int64)
+    dst = dst_times.astype('datetime64[ns]').astype(np.int64)
+    valid = (dst >= src[0]) & (dst <= src[-1])
+
+    if len(src) == 1:
+        zeros = np.zeros(len(dst), dtype=np.int64)
+        return zeros, zeros, np.zeros(len(dst)), valid
+
+    right = np.clip(np.searchsorted(src, dst, side='left'), 1, len(src) - 1)
+    left = right - 1
+    weight = (dst - src[left]) / (src[right] - src[left])
+
+    if method == 'nearest':
+        # Ties go to the earlier time, as with scipy's 'nearest'
+        weight = (weight > 0.5).astype(np.float64)
+
+    return left, right, weight, valid
+
+
+def _interp_window(da, times, left, right, weight, valid, method):
+
+    """
+    Interpolates the time dimension of a DataArray onto `times` using a precomputed
+    index/weight table.
+    """
+
+    if method == 'nearest':
+        out = da.isel(time=np.where(weight > 0, right, left)).drop_vars('time')
+    else:
+        w = xr.DataArray(weight, dims='time')
+        out = da.isel(time=left).drop_vars('time') * (1 - w) + \
+              da.isel(time=right).drop_vars('time') * w
+        out = out.transpose(*da.dims)
+
+    if not valid.all():
+        out = out.where(xr.DataArray(valid, dims='time'))
+
+    return out.assign_coords(time=times)
+
+
+def iter_interpolate_timeseries(ds, freq='7D', method='linear', window=50):
+
+    """
+    A memory-bounded version of `interpolate_timeseries` that interpolates the new time-steps
+    in windows of `window` time-steps and yields each window as soon as it is computed. Only
+    the source time-steps needed by a window are read, so peak memory depends on the window
+    size rather than on the full interpolated output. Each yielded window can be written to
+    disk (e.g. with `to_netcdf`) before the next is computed.
+
+    Interpolation uses a precomputed table of neighbouring indices and weights rather than
+    scipy's general interpolation, so only the 'linear' and 'nearest' methods are supported.
+
+    :param ds:
+        The xarray dataset (or DataArray) to interpolate new time-step observations for. It
+        may be dask-backed, in which case each window is computed as it is yielded.
+
+    :param freq:
+        An optional string giving the frequency at which to interpolate new time-step
+        observations. Defaults to '7D' which interpolates new values at weekly intervals.
+
+    :param method:
+        An optional string giving the interpolation method, either 'linear' (default) or 'nearest'.
+
+    :param window:
+        An optional integer giving the number of new time-steps computed at once. Defaults to 50.
+
+    :return:
+        A generator of xarray datasets (or DataArrays), each covering consecutive new time-steps.
+
+    """
+
+    if method not in ('linear', 'nearest'):
+        raise ValueError("method must be 'linear' or 'nearest', not {}".format(method))
+
+    # Use pandas to generate dates from start to end of ds at a given frequency
+    start_time = ds.isel(time=0).time.values.item()
+    end_time = ds.isel(time=-1).time.values.item()
+    from_to = pd.date_range(start=start_time, end=end_time, freq=freq)
+    left, right, weight, valid = _interp_table(ds.time.values, from_to.values, method)
+
+    print('Interpolating {} time-steps at {} intervals in windows of {}'.format(len(from_to), freq, window))
+
+    for start in range(0, len(from_to), window):
+        end = min(start + window, len(from_to))
+
+        # Read only the source time-steps this window depends on
+        first, last = left[start:end].min(), right[start:end].max()
+        source = ds.isel(time=slice(first, last + 1))
+        table = (from_to[start:end], left[start:end] - first, right[start:end] - first,
+                 weight[start:end], valid[start:end])
+
+        if isinstance(source, xr.Dataset):
+            # Variables without a time dimension are passed through unchanged
+            interpolated = source.drop_dims('time').assign(
+                {name: _interp_window(da, *table, method)
+                 for name, da in source.data_vars.items() if 'time' in da.dims})
+        else:
+            interpolated = _interp_window(source, *table, method)
+
+        yield interpolated.compute()
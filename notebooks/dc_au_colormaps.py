@@ -9,15 +9,33 @@
 #  - dc_au_WaterObservations
 #  - dc_au_Confidence
 #  - dc_au_WaterSummary
+# (each also has a _discrete variant with hard steps).
+#
+# Colormaps are built and registered with matplotlib on first access, either as a module
+# attribute (dc_au_colormaps.dc_au_WaterSummary), through get_colormap(name), or all at once
+# with register_colormaps() - needed before referring to them by name, e.g. cmap='dc_au_WaterSummary'.
+# apply_colormap(array, name) maps rasters straight to uint8 RGBA without matplotlib rendering.
 
+from functools import lru_cache
+
+import numpy as np
 import matplotlib
+import matplotlib.cm
 import matplotlib.colors
 
-def htmlColorMap(html,step=False,name='customColorMap'):
+def _register(cmap):
+    """Register a colormap with matplotlib, replacing any colormap of the same name."""
+    if hasattr(getattr(matplotlib, 'colormaps', None), 'register'):
+        matplotlib.colormaps.register(cmap, force=True)
+    else:
+        matplotlib.cm.register_cmap(cmap=cmap)
+
+def htmlColorMap(html,step=False,name='customColorMap',register=True):
     """Return a dictionary suitable for passing to matplotlib.colors.LinearSegmentedColormap
     html: a sequence of numbers and HTML style (hex string) colors. The numbers will be normalized.
     step: indicates whether the map should be smooth (False, default) or have hard steps (True).
     name: a name for the custom gradient.  Defaults to 'customColorMap'.
+    register: whether to register the colormap with matplotlib.  Defaults to True.
     """
     stops = html[::2]
     cols = html[1::2]
@@ -47,11 +65,15 @@ def htmlColorMap(html,step=False,name='customColorMap'):
 
     #return cdict;
     ret = matplotlib.colors.LinearSegmentedColormap(name,cdict);
-    matplotlib.pyplot.register_cmap(cmap=ret)
+    if register:
+        _register(ret)
     ret.levels = html[::2] # Add a levels property which retains the un-normalized threshold values
     return ret;
 
-dc_au_ClearObservations_discrete = htmlColorMap([
+# Colormap definitions: name -> (html stops and colors, step)
+_SPECS = {}
+
+_SPECS['dc_au_ClearObservations_discrete'] = ([
     0,'#FFFFFF',
     10,'#B21800',
     25,'#FF4400',
@@ -68,9 +90,9 @@ dc_au_ClearObservations_discrete = htmlColorMap([
     700,'#03B500',
     800,'#039500',
     1000,'#026900',
-],True,'dc_au_ClearObservations_discrete')
+], True)
 
-dc_au_ClearObservations = htmlColorMap([
+_SPECS['dc_au_ClearObservations'] = ([
     0,'#FFFFFF',
     10,'#B21800',
     25,'#FF4400',
@@ -87,9 +109,9 @@ dc_au_ClearObservations = htmlColorMap([
     700,'#03B500',
     800,'#039500',
     1000,'#026900',
-],False,'dc_au_ClearObservations')
+], False)
 
-dc_au_WaterObservations_discrete = htmlColorMap([
+_SPECS['dc_au_WaterObservations_discrete'] = ([
     0,'#FFFFFF',
     2,'#890000',
     5,'#990000',
@@ -103,9 +125,9 @@ dc_au_WaterObservations_discrete = htmlColorMap([
     300,'#000FE3',
     350,'#000EA9',
     400,'#5700E3',
-],True,'dc_au_WaterObservations_discrete')
+], True)
 
-dc_au_WaterObservations = htmlColorMap([
+_SPECS['dc_au_WaterObservations'] = ([
     0,'#FFFFFF',
     2,'#890000',
     5,'#990000',
@@ -119,9 +141,9 @@ dc_au_WaterObservations = htmlColorMap([
     300,'#000FE3',
     350,'#000EA9',
     400,'#5700E3',
-],False,'dc_au_WaterObservations')
+], False)
 
-dc_au_Confidence_discrete = htmlColorMap([
+_SPECS['dc_au_Confidence_discrete'] = ([
     0,'#FFFFFF',
     1,'#000000',
     2,'#990000',
@@ -131,9 +153,9 @@ dc_au_Confidence_discrete = htmlColorMap([
     50,'#A6E300',
     75,'#62E300',
     100,'#00E32D',
-],True,'dc_au_Confidence_discrete')
+], True)
 
-dc_au_Confidence = htmlColorMap([
+_SPECS['dc_au_Confidence'] = ([
     0,'#FFFFFF',
     1,'#000000',
     2,'#990000',
@@ -143,9 +165,9 @@ dc_au_Confidence = htmlColorMap([
     50,'#A6E300',
     75,'#62E300',
     100,'#00E32D',
-],False,'dc_au_Confidence')
+], False)
 
-dc_au_WaterSummary_discrete = htmlColorMap([
+_SPECS['dc_au_WaterSummary_discrete'] = ([
     0.2,'#FFFFFF',
     0.5,'#8E0101',
     1,'#CF2200',
@@ -162,9 +184,9 @@ dc_au_WaterSummary_discrete = htmlColorMap([
     90,'#000FE3',
     100,'#5700E3',
     100,'#5700E3'
-],True,'dc_au_WaterSummary_discrete')
+], True)
 
-dc_au_WaterSummary = htmlColorMap([
+_SPECS['dc_au_WaterSummary'] = ([
     0.002,'#FFFFFF',
     0.005,'#8E0101',
     0.01,'#CF2200',
@@ -181,4 +203,78 @@ dc_au_WaterSummary = htmlColorMap([
     0.90,'#000FE3',
     1.00,'#5700E3',
     1.10,'#5700E3',
-],False,'dc_au_WaterSummary')
+], False)
+
+COLORMAP_NAMES = list(_SPECS)
+
+@lru_cache(maxsize=None)
+def get_colormap(name):
+    """Return the named colormap, building and registering it with matplotlib on first access.
+    name: one of the names in COLORMAP_NAMES.
+    """
+    if name not in _SPECS:
+        raise KeyError('Unknown colormap {}; expected one of {}'.format(name, COLORMAP_NAMES))
+    html, step = _SPECS[name]
+    return htmlColorMap(html, step, name)
+
+class _LazyColormap(matplotlib.colors.LinearSegmentedColormap):
+    """A module-level colormap that is built with get_colormap when it is first used.
+    A module __getattr__ would do the same, but needs Python 3.7.  Being a Colormap, it can be
+    passed anywhere matplotlib expects one (e.g. cmap=dc_au_colormaps.dc_au_WaterSummary).
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        # Only called for attributes that are not set yet, i.e. before the colormap is built
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        self.__dict__.update(get_colormap(self.__dict__['name']).__dict__)
+        return object.__getattribute__(self, attr)
+
+for _name in COLORMAP_NAMES:
+    globals()[_name] = _LazyColormap(_name)
+del _name
+
+def register_colormaps():
+    """Build and register every colormap in this module with matplotlib."""
+    for name in COLORMAP_NAMES:
+        get_colormap(name)
+
+@lru_cache(maxsize=None)
+def lookup_table(name, N=256):
+    """Return the colormap as an (N, 4) uint8 RGBA lookup table (cached, read-only).
+    Save it with numpy (e.g. np.save) to reuse it without matplotlib.
+    name: one of the names in COLORMAP_NAMES.
+    N: the number of entries.  Defaults to 256.
+    """
+    cmap = get_colormap(name)
+    lut = cmap(np.linspace(0, 1, N), bytes=True)
+    lut.flags.writeable = False
+    return lut
+
+def apply_colormap(array, name, vmin=None, vmax=None, lut=None):
+    """Map an array of values straight to uint8 RGBA through a colormap lookup table.
+    array: the values to map (any shape). NaN values become fully transparent.
+    name: one of the names in COLORMAP_NAMES.
+    vmin, vmax: the data values mapped to the ends of the colormap.  Default to the first and
+        last thresholds of the colormap (its levels), so values map as in the original stops.
+    lut: an optional precomputed (N, 4) lookup table, e.g. loaded from a saved lookup_table.
+    Returns an array of shape array.shape + (4,).
+    """
+    if lut is None:
+        lut = lookup_table(name)
+    levels = [float(level) for level in _SPECS[name][0][::2]]
+    vmin = min(levels) if vmin is None else vmin
+    vmax = max(levels) if vmax is None else vmax
+    N = len(lut)
+
+    # Same binning as matplotlib: scale to [0, N], then clip into the table
+    index = np.asarray(array, dtype=np.float32) - vmin
+    index *= N / (vmax - vmin)
+    nan = np.isnan(index)
+    np.clip(index, 0, N - 1, out=index)
+    index[nan] = 0
+    rgba = lut[index.astype(np.intp)]
+    rgba[nan] = 0
+    return rgba
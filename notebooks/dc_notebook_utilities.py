@@ -4,10 +4,86 @@ from typing import List
 
 from matplotlib.colors import LinearSegmentedColormap
 import math # ceil
+import time as _time
+import weakref
 
 import datacube
 
 
+class ProductCatalog:
+    """
+    Description:
+      A cached view of the products in a Datacube index with a platform -> products index,
+      so GUI helpers do not query the index on every widget interaction. The catalog is
+      built on first use and rebuilt after `invalidate()` or once it is older than `ttl`.
+    -----
+    Input:
+      datacube (datacube.Datacube): the Datacube to list products from
+      ttl (numeric): optional; the number of seconds before the catalog is rebuilt
+    """
+    def __init__(self, datacube, ttl=None):
+        self.datacube = datacube
+        self.ttl = ttl
+        self._products = None
+        self._by_platform = None
+        self._built = None
+
+    def _expired(self):
+        return self._products is None or \
+               (self.ttl is not None and _time.monotonic() - self._built > self.ttl)
+
+    def _ensure_built(self):
+        """Builds the catalog if it has not been built yet or has expired."""
+        if self._expired():
+            self._products = self.datacube.list_products()
+            platforms = self._products["platform"] if "platform" in self._products \
+                        else [None] * len(self._products)
+            self._by_platform = {}
+            for name, platform in zip(self._products["name"], platforms):
+                self._by_platform.setdefault(platform, []).append(name)
+            self._built = _time.monotonic()
+
+    @property
+    def products(self):
+        """The pandas DataFrame returned by `datacube.list_products()`."""
+        self._ensure_built()
+        return self._products
+
+    def platform_products(self, platform, products=None):
+        """
+        Returns the names of the products of a platform, optionally restricted to `products`
+        (keeping the index order).
+        """
+        self._ensure_built()
+        names = self._by_platform.get(platform, [])
+        if products is not None:
+            products = set(products)
+            names = [name for name in names if name in products]
+        return names
+
+    def invalidate(self):
+        """Forces the catalog to be rebuilt on next use."""
+        self._products = None
+        self._by_platform = None
+
+
+_catalogs = weakref.WeakKeyDictionary()
+
+def get_product_catalog(datacube, ttl=None):
+    """
+    Description:
+      Returns the ProductCatalog shared by the GUI helpers in this module for `datacube`,
+      creating it on first use. A `ttl` given here replaces the catalog's current one.
+    -----
+    """
+    catalog = _catalogs.get(datacube)
+    if catalog is None:
+        catalog = _catalogs[datacube] = ProductCatalog(datacube, ttl=ttl)
+    elif ttl is not None:
+        catalog.ttl = ttl
+    return catalog
+
+
 def create_acq_date_gui(acq_dates):
     """
     Description:
@@ -30,18 +106,22 @@ def create_platform_product_gui(platforms: List[str],
                                 products:  List[str],
                                 datacube:  datacube.Datacube,
                                 default_platform:str = None,
-                                default_product:str  = None,):
+                                default_product:str  = None,
+                                catalog:ProductCatalog = None,):
     """
     Description:
       
     -----
+    Input:
+      catalog (ProductCatalog): optional; the product catalog to use. Defaults to the
+        catalog shared by this module for `datacube` (see get_product_catalog).
     """
     plat_selected = [None]
     prod_selected = [None]
+    catalog = catalog if catalog is not None else get_product_catalog(datacube)
     
     def parse_widget(x):
-        var = datacube.list_products()
-        return var["name"][(var["platform"] == x) & (var["name"].isin(products))]
+        return catalog.platform_products(x, products)
     
     def get_keys(platform):
         products = [x for x in parse_widget(platform)]
@@ -235,6 +315,81 @@ def rgb(dataset,
         plt.imshow(rgb)  
     
     plt.show()
+
+def rgb_fast(dataset,
+             at_index = 0,
+             bands = ['red', 'green', 'blue'],
+             paint_on_mask = [],
+             max_possible = 3500,
+             width = 10,
+             figsize = None,
+             max_size = 2048
+            ):
+    """
+    Description:
+      A lower-memory version of `rgb` for previewing large (possibly dask-backed) datasets.
+      Only the time slice at `at_index` is read, images larger than `max_size` pixels along
+      either side are block-mean downsampled before the bands are stacked, and the image is
+      built in place as uint8. Unlike `rgb`, values are normalized by the maximum of the
+      displayed frame rather than of every timestep.
+    -----
+    Input:
+      dataset (xarray.Dataset): the dataset to display; may be dask-backed
+      at_index (int): the time index to display if the dataset has a time dimension
+      bands (list): the bands to use as red, green and blue
+      paint_on_mask (list): (mask, color) pairs; mask is a boolean array shaped like the
+        dataset (with or without time) and color is a 3-tuple of rgb values in range [0,255]
+      max_possible (numeric): values above this are treated as saturated
+      width (numeric): the figure width if figsize is not given
+      figsize (tuple): the figure size
+      max_size (int): the maximum number of pixels displayed along either side
+    """
+    if 'time' in dataset.dims:
+        dataset = dataset.isel(time = at_index)
+        paint_on_mask = [(mask[at_index] if np.ndim(mask) == 3 else mask, color) for mask, color in paint_on_mask]
+    dataset = dataset[bands]
+    y_dim, x_dim = dataset[bands[0]].dims[-2:]
+
+    # Downsample with a block mean so only a screen-sized image is ever stacked
+    factor = int(np.ceil(max(dataset.sizes[y_dim], dataset.sizes[x_dim]) / max_size))
+    if factor > 1:
+        dataset = dataset.coarsen({y_dim: factor, x_dim: factor}, boundary = 'trim').mean()
+    ny, nx = dataset.sizes[y_dim], dataset.sizes[x_dim]
+
+    rgb = np.empty((ny, nx, 3), dtype = np.float32)
+    for i, band in enumerate(bands):
+        rgb[..., i] = dataset[band].values
+    np.clip(rgb, 0, max_possible, out = rgb)
+    np.nan_to_num(rgb, copy = False)
+    rgb *= 255 / max(float(rgb.max()), 1e-6)
+    image = rgb.astype(np.uint8)
+    del rgb
+
+    ### < takes a T/F mask, apply a color to T areas
+    for mask, color in paint_on_mask:
+        mask = np.asarray(mask, dtype = bool)
+        if factor > 1:
+            # A block is painted if any of its pixels are
+            mask = mask[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor).any(axis = (1, 3))
+        image[mask] = np.array(color, dtype = np.uint8)
+    ### >
+
+    if figsize is None:
+        figsize = (width, ny * (width / nx))
+    fig, ax = plt.subplots(figsize = figsize)
+
+    lats = dataset[y_dim].values
+    lons = dataset[x_dim].values
+    lat_formatter = FuncFormatter(lambda x, pos: round(lats[int(np.clip(x, 0, ny - 1))], 4))
+    lon_formatter = FuncFormatter(lambda x, pos: round(lons[int(np.clip(x, 0, nx - 1))], 4))
+
+    plt.ylabel("Latitude")
+    ax.yaxis.set_major_formatter(lat_formatter)
+    plt.xlabel("Longitude")
+    ax.xaxis.set_major_formatter(lon_formatter)
+
+    plt.imshow(image)
+    plt.show()
     
 def create_discrete_color_map(data_range, th, colors, cmap_name='my_cmap'):
     """
@@ -280,3 +435,140 @@ def create_discrete_color_map(data_range, th, colors, cmap_name='my_cmap'):
     cmap = LinearSegmentedColormap(cmap_name, cdict)
     return cmap
 
+
+def discrete_color_palette(th, colors):
+    """
+    Creates the uint8 RGBA palette matching `create_discrete_color_map`, for use without matplotlib rendering.
+    
+    Parameters
+    ----------
+    th: list
+        Threshold values, as for `create_discrete_color_map`.
+    colors: list
+        Colors to use between thresholds, so `len(colors) == len(th)+1`.
+        Colors can be string names of matplotlib colors, 3-tuples of rgb values in range [0,255],
+        or lists of rgb values in range [0,1] (as left in `colors` by `create_discrete_color_map`).
+    
+    Returns
+    -------
+    palette: numpy.ndarray
+        A `(len(colors)+1, 4)` uint8 array. Entry `i` is the color of class `i` and the last entry
+        is fully transparent, for no data.
+    """
+    import matplotlib as mpl
+    if len(colors) != len(th) + 1:
+        raise ValueError("`colors` must have one more entry than `th`.")
+    palette = np.zeros((len(colors) + 1, 4), dtype=np.uint8)
+    for i, color in enumerate(colors):
+        if isinstance(color, str):
+            rgb = mpl.colors.to_rgb(color)
+        elif isinstance(color, tuple):
+            rgb = [val/255 for val in color]
+        else:
+            rgb = color
+        palette[i, :3] = np.round(np.array(rgb[:3]) * 255)
+        palette[i, 3] = 255
+    return palette
+
+def apply_discrete_color_map(data, th, nodata=None):
+    """
+    Classifies values by the thresholds of a discrete color map with `np.digitize`, giving the
+    palette index of each value (see `discrete_color_palette`).
+    
+    Parameters
+    ----------
+    data: numpy.ndarray
+        The values to classify.
+    th: list
+        Threshold values, as for `create_discrete_color_map`.
+    nodata: numeric
+        An optional no data value. No data and NaN values get the last (transparent) palette index.
+    
+    Returns
+    -------
+    classes: numpy.ndarray
+        A uint8 array of palette indices with the shape of `data`.
+    """
+    data = np.asarray(data)
+    classes = np.digitize(data, th).astype(np.uint8)
+    invalid = np.isnan(data) if np.issubdtype(data.dtype, np.floating) else np.zeros(data.shape, dtype=bool)
+    if nodata is not None:
+        invalid |= data == nodata
+    classes[invalid] = len(th) + 1
+    return classes
+
+def export_discrete_color_raster(data, path, th, colors, transform=None, crs=None, nodata=None,
+                                 driver='GTiff', block_rows=1024):
+    """
+    Writes a 2D raster (e.g. WOFS or classification output) as a compressed, paletted uint8 image
+    using the same `th`/`colors` definition as `create_discrete_color_map`. The raster is classified
+    and written `block_rows` rows at a time, so arbitrarily large (including dask-backed) rasters can
+    be exported without rendering through matplotlib.
+    
+    Parameters
+    ----------
+    data: xarray.DataArray or numpy.ndarray
+        A 2D raster. Only `block_rows` rows of a dask-backed DataArray are computed at a time.
+    path: str
+        The output file path.
+    th: list
+        Threshold values, as for `create_discrete_color_map`.
+    colors: list
+        Colors to use between thresholds, as for `discrete_color_palette`.
+    transform: affine.Affine
+        The geotransform of the raster. Defaults to `data.geobox.transform` if available.
+    crs: str
+        The CRS of the raster. Defaults to `data.geobox.crs` if available.
+    nodata: numeric
+        An optional no data value, written as transparent.
+    driver: str
+        'GTiff' (default) writes a tiled, deflate-compressed GeoTIFF directly.
+        Other GDAL drivers that only support copying (e.g. 'PNG' or 'COG') are written from a
+        temporary GeoTIFF.
+    block_rows: int
+        The number of rows classified and written at a time.
+    """
+    import os
+    import tempfile
+    import rasterio
+    import rasterio.shutil
+    from rasterio.windows import Window
+    
+    if data.ndim != 2:
+        raise ValueError("`data` must be two-dimensional.")
+    geobox = getattr(data, 'geobox', None)
+    if transform is None and geobox is not None:
+        transform = geobox.transform
+    if crs is None and geobox is not None:
+        crs = str(geobox.crs)
+    
+    palette = discrete_color_palette(th, colors)
+    height, width = data.shape
+    profile = dict(driver='GTiff', width=width, height=height, count=1, dtype='uint8',
+                   nodata=len(th) + 1, compress='deflate', tiled=True,
+                   blockxsize=256, blockysize=256)
+    if transform is not None:
+        profile.update(transform=transform)
+    if crs is not None:
+        profile.update(crs=crs)
+    
+    tiff_path = path
+    if driver != 'GTiff':
+        tmp_dir = tempfile.mkdtemp()
+        tiff_path = os.path.join(tmp_dir, 'palette.tif')
+    
+    with rasterio.open(tiff_path, 'w', **profile) as dst:
+        for row in range(0, height, block_rows):
+            rows = min(block_rows, height - row)
+            block = data[row:row + rows]
+            block = block.values if hasattr(block, 'values') else block
+            dst.write(apply_discrete_color_map(block, th, nodata=nodata),
+                      1, window=Window(0, row, width, rows))
+        dst.write_colormap(1, {i: tuple(int(val) for val in color) for i, color in enumerate(palette)})
+    
+    if driver != 'GTiff':
+        try:
+            rasterio.shutil.copy(tiff_path, path, driver=driver)
+        finally:
+            os.remove(tiff_path)
+            os.rmdir(tmp_dir)
@@ -64,3 +64,93 @@ def get_bounds(times,values, standard_deviations = 1 ):
     end_index   = int(popt[1] + (standard_deviations*popt[2]))
     
     return times[start_index], times[end_index]
+
+
+def _initial_estimates(x, y, valid):
+    ''' Vectorized (A, mu, sigma) starting values for every series (columns of y) from weighted moments, refined by a log-parabola through the peak where possible '''
+    w = np.where(valid, np.clip(y, 0, None), 0)
+    total = w.sum(axis=0)
+    total[total == 0] = 1
+    mu = (x[:, None] * w).sum(axis=0) / total
+    sigma = np.sqrt((w * (x[:, None] - mu)**2).sum(axis=0) / total)
+    A = np.where(valid, y, -np.inf).max(axis=0)
+
+    # Log-parabola through the peak and its neighbours: log(y) = a + b*x + c*x**2
+    peak = np.clip(np.where(valid, y, -np.inf).argmax(axis=0), 1, len(x) - 2)
+    cols = np.arange(y.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        l0, l1, l2 = [np.log(y[peak + i, cols]) for i in (-1, 0, 1)]
+        c = (l0 - 2 * l1 + l2) / 2
+        parabola_mu = x[peak] - (l2 - l0) / (4 * c)
+        parabola_sigma = np.sqrt(-1 / (2 * c))
+    usable = np.isfinite(parabola_mu) & np.isfinite(parabola_sigma) & (c < 0) \
+             & valid[peak - 1, cols] & valid[peak, cols] & valid[peak + 1, cols]
+    mu = np.where(usable, parabola_mu, mu)
+    sigma = np.where(usable, parabola_sigma, sigma)
+    sigma[~(sigma > 0)] = 1.
+    A[~np.isfinite(A)] = 0.
+    return A, mu, sigma
+
+def fit_gaussians(values, iterations = 50, damping = 1e-3, tolerance = 1e-8):
+    ''' Fits a gaussian curve to every time series of a cube at once.
+
+    values: array with time along the first axis (e.g. a GPM cube of shape (time, lat, lon)); NaN values are ignored
+    iterations: maximum number of batched (damped) Gauss-Newton refinement steps
+    tolerance: series stop being refined once their relative improvement falls below this
+    Returns arrays of A, mu and sigma with the shape of values without its time axis
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    shape = values.shape[1:]
+    y = values.reshape(len(values), -1)
+    x = np.arange(len(values), dtype=np.float64)[:, None]
+    valid = np.isfinite(y)
+    y = np.where(valid, y, 0)
+
+    params = np.stack(_initial_estimates(x[:, 0], y, valid), axis=-1)
+    lam = np.full(y.shape[1], damping)
+    cost = (np.where(valid, y - gauss(x, *params.T), 0)**2).sum(axis=0)
+    active = np.arange(y.shape[1])
+
+    for _ in range(iterations):
+        if len(active) == 0:
+            break
+        p, ya, va, la = params[active], y[:, active], valid[:, active], lam[active]
+        A, mu, sigma = p.T
+        d = x - mu
+        e = np.where(va, np.exp(-d**2 / (2 * sigma**2)), 0)
+        r = np.where(va, ya - A * e, 0)
+        # Jacobian columns of the gaussian with respect to (A, mu, sigma), one row per time
+        J = (e, A * e * d / sigma**2, A * e * d**2 / sigma**3)
+        JtJ = np.empty((len(active), 3, 3))
+        for i in range(3):
+            for j in range(i, 3):
+                JtJ[:, i, j] = JtJ[:, j, i] = (J[i] * J[j]).sum(axis=0)
+        Jtr = np.stack([(Ji * r).sum(axis=0) for Ji in J], axis=-1)
+        # Levenberg-Marquardt damping keeps every 3x3 system solvable
+        diagonal = JtJ.diagonal(axis1=1, axis2=2)
+        JtJ[:, [0, 1, 2], [0, 1, 2]] += la[:, None] * diagonal + 1e-12
+        candidate = p + np.linalg.solve(JtJ, Jtr[..., None])[..., 0]
+        candidate[:, 2] = np.abs(candidate[:, 2])
+        candidate_cost = (np.where(va, ya - gauss(x, *candidate.T), 0)**2).sum(axis=0)
+
+        improved = np.isfinite(candidate_cost) & (candidate_cost < cost[active])
+        converged = improved & (cost[active] - candidate_cost <= tolerance * cost[active])
+        params[active[improved]] = candidate[improved]
+        cost[active[improved]] = candidate_cost[improved]
+        lam[active] = np.where(improved, la / 10, la * 10)
+        # Drop series that have converged or can no longer make progress
+        active = active[~converged & (lam[active] < 1e12)]
+
+    return tuple(params[:, i].reshape(shape) for i in range(3))
+
+def get_bounds_batched(values, standard_deviations = 1, iterations = 50):
+    ''' Vectorized get_bounds for every time series of a cube (time along the first axis).
+
+    Returns the start and end time index arrays of mu -/+ standard_deviations*sigma, clipped to the time range
+    (index a time array with them, e.g. times[start_index], to get dates)
+    '''
+    A, mu, sigma = fit_gaussians(values, iterations = iterations)
+    n = len(values)
+    start_index = np.clip(np.trunc(mu - standard_deviations*sigma), 0, n - 1).astype(int)
+    end_index   = np.clip(np.trunc(mu + standard_deviations*sigma), 0, n - 1).astype(int)
+    return start_index, end_index
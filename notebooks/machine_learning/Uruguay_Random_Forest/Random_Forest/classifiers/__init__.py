@@ -1 +1,3 @@
+from .flat_forest import FlatForest
 from .forest_classifier import ForestClassifier
+from .profiling import StageProfiler, StageRecord, logging_sink
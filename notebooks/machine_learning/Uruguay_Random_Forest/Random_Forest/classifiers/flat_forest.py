@@ -0,0 +1,171 @@
+"""
+A flattened, array-based representation of a trained random forest.
+Copyright 2019 United States Government as represented by the Administrator
+of the National Aeronautics and Space Administration. All Rights Reserved.
+
+The CEOS 2 platform is licensed under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+"""
+import numpy as np
+
+class FlatForest:
+    """A random forest stored as contiguous numpy arrays for vectorized inference.
+
+    Every tree of the forest is laid out end to end in the same arrays, so a batch of
+    pixels can be pushed through all of the trees at once. Leaves point back to
+    themselves, which lets every tree be traversed for a fixed number of steps.
+
+    Attributes:
+        feature (numpy.ndarray): The feature index tested at each node.
+        threshold (numpy.ndarray): The split threshold of each node (infinite for leaves).
+        children_left (numpy.ndarray): The global index of the left child of each node.
+        children_right (numpy.ndarray): The global index of the right child of each node.
+        value (numpy.ndarray): The class probabilities of each node, shape (nodes, classes).
+        roots (numpy.ndarray): The global index of the root node of each tree.
+        classes (numpy.ndarray): The class labels, indexed by the integer labels returned by predict.
+        max_depth (int): The depth of the deepest tree.
+    """
+
+    def __init__(self, feature, threshold, children_left, children_right,
+                 value, roots, classes, max_depth):
+        """Inits FlatForest from already flattened arrays."""
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.classes = classes
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_sklearn(cls, rf):
+        """Flattens a trained scikit-learn RandomForestClassifier.
+
+        Args:
+            rf (sklearn.ensemble.RandomForestClassifier): The trained classifier.
+
+        Returns:
+            A FlatForest making the same predictions as the given classifier.
+        """
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        max_depth = 0
+        offset = 0
+        for estimator in rf.estimators_:
+            tree = estimator.tree_
+            leaves = tree.children_left == -1
+            nodes = np.arange(tree.node_count)
+            feature.append(np.where(leaves, 0, tree.feature))
+            threshold.append(np.where(leaves, np.inf, tree.threshold))
+            left.append(np.where(leaves, nodes, tree.children_left) + offset)
+            right.append(np.where(leaves, nodes, tree.children_right) + offset)
+            # Normalize leaf values into probabilities, as predict_proba does
+            counts = tree.value[:, 0, :]
+            totals = counts.sum(axis=1, keepdims=True)
+            totals[totals == 0] = 1
+            value.append(counts / totals)
+            roots.append(offset)
+            max_depth = max(max_depth, tree.max_depth)
+            offset += tree.node_count
+
+        return cls(feature=np.concatenate(feature).astype(np.intp),
+                   threshold=np.concatenate(threshold).astype(np.float64),
+                   children_left=np.concatenate(left).astype(np.intp),
+                   children_right=np.concatenate(right).astype(np.intp),
+                   value=np.concatenate(value).astype(np.float64),
+                   roots=np.array(roots, dtype=np.intp),
+                   classes=np.asarray(rf.classes_),
+                   max_depth=max_depth)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a FlatForest saved with FlatForest.save.
+
+        Args:
+            path (string): The path to the .npz model file.
+
+        Returns:
+            The loaded FlatForest.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(feature=arrays['feature'].astype(np.intp),
+                       threshold=arrays['threshold'],
+                       children_left=arrays['children_left'].astype(np.intp),
+                       children_right=arrays['children_right'].astype(np.intp),
+                       value=arrays['value'],
+                       roots=arrays['roots'].astype(np.intp),
+                       classes=arrays['classes'],
+                       max_depth=arrays['max_depth'])
+
+    def save(self, path):
+        """Saves the forest as an uncompressed .npz file that loads without unpickling.
+
+        Args:
+            path (string): The path to write the model file to.
+        """
+        np.savez(path,
+                 feature=self.feature.astype(np.int32),
+                 threshold=self.threshold,
+                 children_left=self.children_left.astype(np.int32),
+                 children_right=self.children_right.astype(np.int32),
+                 value=self.value,
+                 roots=self.roots.astype(np.int32),
+                 classes=self.classes.astype(str),
+                 max_depth=np.array(self.max_depth))
+
+    def class_index(self, label):
+        """Gets the integer label of a class.
+
+        Args:
+            label: The class label as used when training (ex: 'Forest').
+
+        Returns:
+            The integer returned by predict for that class.
+        """
+        matches = np.flatnonzero(self.classes == label)
+        if(len(matches) == 0):
+            raise ValueError('{} is not one of the model classes: {}'.format(label, list(self.classes)))
+        return int(matches[0])
+
+    def predict_proba(self, X, batch_size=16384):
+        """Computes the class probabilities averaged over every tree.
+
+        Args:
+            X (numpy.ndarray): A 2D array of feature values, one row per pixel.
+            batch_size (int): The number of rows traversed at once.
+
+        Returns:
+            A float64 array of shape (rows, classes).
+        """
+        # Trees are trained and evaluated on float32 features
+        X = np.asarray(X, dtype=np.float32)
+        proba = np.empty((len(X), len(self.classes)), dtype=np.float64)
+        for start in range(0, len(X), batch_size):
+            batch = X[start:start + batch_size]
+            rows = np.arange(len(batch))
+            node = np.repeat(self.roots[:, None], len(batch), axis=1)
+            for _ in range(self.max_depth):
+                go_left = batch[rows, self.feature[node]] <= self.threshold[node]
+                node = np.where(go_left, self.children_left[node], self.children_right[node])
+            proba[start:start + batch_size] = self.value[node].mean(axis=0)
+        return proba
+
+    def predict(self, X, batch_size=16384):
+        """Predicts integer class labels (indices into FlatForest.classes).
+
+        Args:
+            X (numpy.ndarray): A 2D array of feature values, one row per pixel.
+            batch_size (int): The number of rows traversed at once.
+
+        Returns:
+            An integer array with one label per row.
+        """
+        return self.predict_proba(X, batch_size=batch_size).argmax(axis=1)
@@ -26,6 +26,7 @@ from sys import path
 path.append("../../")
 
 import datetime 
+from contextlib import contextmanager
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -34,6 +35,14 @@ from sklearn.externals import joblib
 from utils.data_cube_utilities.dc_frac import frac_coverage_classify
 from utils.data_cube_utilities.dc_mosaic import create_median_mosaic
 
+from .flat_forest import FlatForest
+from .profiling import StageProfiler
+
+@contextmanager
+def _unprofiled():
+    """A no-op stage used when no profiler is set (contextlib.nullcontext needs Python 3.7)."""
+    yield
+
 def NDVI(dataset: xr.Dataset) -> xr.DataArray:
     return (dataset.nir - dataset.red)/(dataset.nir + dataset.red).rename("NDVI")
 
@@ -104,14 +113,56 @@ class ForestClassifier:
     
     Attributes:
         model_path (string): The path to the binary Random Forest Classifier model file.
+            Paths ending in .npz are loaded as a compiled FlatForest (see compile_model).
+        profiler (StageProfiler): Optional; records the wall time and peak memory of each stage
+            and feature function. True creates a StageProfiler without a sink.
     """
     
-    def __init__(self, model_path=None):
+    def __init__(self, model_path=None, profiler=None):
         """Inits ForestClassification with model location."""
         if(model_path is None):
             raise TypeError('model_path is NoneType. Please supply a string for model_path.')
             
         self.model_path = model_path
+        self.profiler = StageProfiler() if profiler is True else profiler
+        self._model = None
+        
+    def _stage(self, name):
+        """Profiles the enclosed block as `name` when a profiler is set."""
+        if(self.profiler is None):
+            return _unprofiled()
+        return self.profiler.stage(name)
+        
+    def load_model(self):
+        """Loads the model once and keeps it for later calls.
+        
+        Returns:
+            A FlatForest if model_path is a compiled .npz model, otherwise the unpickled scikit-learn model.
+        """
+        if(self._model is None):
+            if(str(self.model_path).endswith('.npz')):
+                self._model = FlatForest.load(self.model_path)
+            else:
+                self._model = joblib.load(self.model_path)
+        return self._model
+    
+    def compile_model(self, output_path):
+        """Converts the pickled scikit-learn model into a compiled FlatForest model file.
+        
+        Args:
+            output_path (string): The path to write the .npz model file to.
+            
+        Returns:
+            A ForestClassifier using the compiled model.
+        """
+        model = self.load_model()
+        if(not isinstance(model, FlatForest)):
+            model = FlatForest.from_sklearn(model)
+        model.save(output_path)
+        # np.savez appends the extension if it is missing
+        if(not str(output_path).endswith('.npz')):
+            output_path = '{}.npz'.format(output_path)
+        return ForestClassifier(output_path, profiler=self.profiler)
          
     def validate_xarray(self, dims, dataset: xr.Dataset):
         """Validates an Xarray Dataset
@@ -180,11 +231,12 @@ class ForestClassifier:
                              'swir2'
                             )
         # Validate the dataset and mask
-        dataset = self.validate_xarray(REQUIRED_FEATURES, dataset)
-        mask = self.validate_mask(mask)
+        with self._stage('validate'):
+            dataset = self.validate_xarray(REQUIRED_FEATURES, dataset)
+            mask = self.validate_mask(mask)
         
-        
-        composite = create_median_mosaic(dataset, clean_mask=mask)
+        with self._stage('create_median_mosaic'):
+            composite = create_median_mosaic(dataset, clean_mask=mask)
 
         if(hasattr(composite, 'pixel_qa')):
             composite = composite.drop('pixel_qa')
@@ -207,12 +259,13 @@ class ForestClassifier:
         
         # Build the features by iterating over tuple of feature methods
         for i in range(len(feature_list)):
-            if(feature_list[i].__name__ == 'NDVI_coeff_var'):
-                features[feature_list[i].__name__] = feature_list[i](dataset, mask = mask)
-            elif(feature_list[i].__name__ == 'fractional_cover_2d'):
-                features = features.merge(fractional_cover_2d(composite))
-            else:
-                features[feature_list[i].__name__] = feature_list[i](composite)
+            with self._stage('feature:{}'.format(feature_list[i].__name__)):
+                if(feature_list[i].__name__ == 'NDVI_coeff_var'):
+                    features[feature_list[i].__name__] = feature_list[i](dataset, mask = mask)
+                elif(feature_list[i].__name__ == 'fractional_cover_2d'):
+                    features = features.merge(fractional_cover_2d(composite))
+                else:
+                    features[feature_list[i].__name__] = feature_list[i](composite)
         features.NDVI_coeff_var.values[ np.isnan(features.NDVI_coeff_var.values)] = 0
         
         return features
@@ -231,28 +284,35 @@ class ForestClassifier:
             True: Forest
             False: Not Forest
         """
-        features = self.build_features(dataset, mask)
+        with self._stage('build_features'):
+            features = self.build_features(dataset, mask)
         
         # Convert the Dataset to a DataFrame for ease of use
-        features = features.to_dataframe()
+        with self._stage('to_dataframe'):
+            features = features.to_dataframe()
         
         # Load the model
-        rf = joblib.load(self.model_path)
+        with self._stage('load_model'):
+            rf = self.load_model()
         
-        # Grab the feature values as a numpy array and split into smaller chunks
+        # Grab the feature values as a numpy array
         X = features.values
-        X = np.array_split(X, 100)
         
-        # Generate a classification for each chunk and concatenate into one array
-        y_pred = []
-        for i in range(len(X)):
-            y_pred.append(rf.predict(X[i]))
-        y_pred = np.concatenate(y_pred)
-        y_pred = np.isin(y_pred, 'Forest')
-        
-        # Append the array to the features DataFrame
-        df = pd.DataFrame(y_pred, columns=['forest'])
-        features['forest'] = df.values
+        with self._stage('predict'):
+            if(isinstance(rf, FlatForest)):
+                # Compiled models traverse every tree over batches of pixels and return integer labels
+                y_pred = rf.predict(X) == rf.class_index('Forest')
+            else:
+                # Split into smaller chunks, generate a classification for each chunk and concatenate into one array
+                X = np.array_split(X, 100)
+                y_pred = []
+                for i in range(len(X)):
+                    y_pred.append(rf.predict(X[i]))
+                y_pred = np.concatenate(y_pred)
+                y_pred = np.isin(y_pred, 'Forest')
         
-        # Return the DataFrame as a Dataset
-        return xr.Dataset.from_dataframe(features)
\ No newline at end of file
+        # Append the array to the features DataFrame and return it as a Dataset
+        with self._stage('from_dataframe'):
+            df = pd.DataFrame(y_pred, columns=['forest'])
+            features['forest'] = df.values
+            return xr.Dataset.from_dataframe(features)
\ No newline at end of file
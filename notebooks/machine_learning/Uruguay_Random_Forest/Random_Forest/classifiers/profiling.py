@@ -0,0 +1,107 @@
+"""
+Optional per-stage instrumentation for the forest classifier.
+Copyright 2019 United States Government as represented by the Administrator
+of the National Aeronautics and Space Administration. All Rights Reserved.
+
+The CEOS 2 platform is licensed under the Apache License, Version 2.0 (the
+"License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+http://www.apache.org/licenses/LICENSE-2.0.
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+"""
+import logging
+import time
+import tracemalloc
+from collections import namedtuple
+from contextlib import contextmanager
+
+import pandas as pd
+
+StageRecord = namedtuple('StageRecord', 'stage seconds peak_bytes')
+
+logger = logging.getLogger(__name__)
+
+def logging_sink(record):
+    """A sink that logs each stage record at INFO level.
+
+    Args:
+        record (StageRecord): The record of a finished stage.
+    """
+    logger.info('%s: %.3f s, %.1f MiB peak', record.stage, record.seconds, record.peak_bytes / 2**20)
+
+class StageProfiler:
+    """Records the wall time and peak memory of named stages.
+
+    Peak memory is the largest amount of memory allocated through Python (as traced by
+    tracemalloc) above what was allocated when the stage started. Stages may be nested;
+    an outer stage includes the peaks of the stages inside it. Measuring the peak of a
+    single stage needs tracemalloc.reset_peak (Python 3.9+); on older versions peak_bytes
+    is recorded as NaN.
+
+    Attributes:
+        sink (callable): Optional; called with every StageRecord as its stage finishes.
+            Share a sink between profilers to aggregate across batch runs.
+        records (list): The StageRecords collected by this profiler.
+    """
+
+    def __init__(self, sink=None):
+        """Inits StageProfiler with an optional record sink."""
+        self.sink = sink
+        self.records = []
+        self._peaks = []
+
+    @contextmanager
+    def stage(self, name):
+        """A context manager timing the enclosed block as the stage `name`.
+
+        Args:
+            name (string): The name to record the stage under.
+        """
+        started = not tracemalloc.is_tracing()
+        if(started):
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        # Keep the enclosing stage's peak before it is reset for this one
+        if(self._peaks):
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        if(hasattr(tracemalloc, 'reset_peak')):
+            tracemalloc.reset_peak()
+        self._peaks.append(current)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = max(tracemalloc.get_traced_memory()[1], self._peaks.pop())
+            if(self._peaks):
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            if(started):
+                tracemalloc.stop()
+            peak_bytes = peak - current if hasattr(tracemalloc, 'reset_peak') else float('nan')
+            record = StageRecord(stage=name, seconds=seconds, peak_bytes=peak_bytes)
+            self.records.append(record)
+            if(self.sink is not None):
+                self.sink(record)
+
+    def report(self):
+        """Summarizes the collected records per stage.
+
+        Returns:
+            A pandas DataFrame indexed by stage with the number of calls, the total and mean
+            wall time in seconds and the largest peak memory in bytes.
+        """
+        records = pd.DataFrame(self.records, columns=StageRecord._fields)
+        report = records.groupby('stage', sort=False).agg(calls=('seconds', 'size'),
+                                                         seconds=('seconds', 'sum'),
+                                                         mean_seconds=('seconds', 'mean'),
+                                                         peak_bytes=('peak_bytes', 'max'))
+        return report
+
+    def clear(self):
+        """Removes all collected records."""
+        self.records = []
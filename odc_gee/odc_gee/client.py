@@ -0,0 +1,431 @@
+# pylint: disable=import-error,too-many-arguments
+""" HTTP clients for the Google Earth Engine REST API.
+
+Client makes blocking calls over the pooled, keep-alive HTTP session of an
+odc_gee.earthengine.Session, so it can be shared between threads. FailoverClient does the
+same for a pool of sessions with separate quotas. AsyncClient keeps one
+pooled aiohttp session open, so many listImages, asset and STAC requests can be in flight
+at once from a single thread. It requires aiohttp, which is installed with the `async`
+extra (pip install odc-gee[async]). Without it, ThreadedClient offers the same interface
+by running a Client's calls in a thread pool.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import re
+import threading
+import time
+
+API_URL = 'https://earthengine.googleapis.com/v1alpha'
+STAC_URL = 'https://storage.googleapis.com/earthengine-stac/catalog'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def asset_name(asset):
+    ''' Converts an asset ID to a REST API asset name, as ee.data.convert_asset_id_to_asset_name.
+
+    Args:
+        asset (str): The asset ID (ex: LANDSAT/LC08/C01/T1_SR) or asset name.
+
+    Returns: The asset name (ex: projects/earthengine-public/assets/LANDSAT/LC08/C01/T1_SR).
+    '''
+    if re.match(r'^projects/[^/]+/assets/', asset):
+        return asset
+    if asset.split('/')[0] in ['users', 'projects']:
+        return f'projects/earthengine-legacy/assets/{asset}'
+    return f'projects/earthengine-public/assets/{asset}'
+
+def asset_id(name):
+    ''' Converts a REST API asset name to an asset ID, the reverse of asset_name.
+
+    Args:
+        name (str): The asset name (ex: projects/earthengine-public/assets/LANDSAT/LC08).
+
+    Returns: The asset ID (ex: LANDSAT/LC08).
+    '''
+    match = re.match(r'^projects/earthengine-(public|legacy)/assets/(.*)$', name)
+    return match.group(2) if match else name
+
+class ClientError(Exception):
+    ''' An error response from the Earth Engine REST API.
+
+    Attributes:
+        status (int): The HTTP status of the response.
+    '''
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class RateLimiter:
+    ''' Spaces out requests to stay under a rate, shared between threads.
+
+    Attributes:
+        rate (float): The most requests per second.
+    '''
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        ''' Reserves the next free request slot.
+
+        Returns: The number of seconds to wait before making the request.
+        '''
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1 / self.rate
+        return slot - now
+
+    def wait(self):
+        ''' Blocks until a request can be made. '''
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+class Client:
+    ''' A client for Earth Engine listing and metadata calls, safe to share between threads.
+
+    Attributes:
+        session (odc_gee.earthengine.Session): The session authorizing requests and holding
+            the pooled HTTP connections.
+        api_url (str): The base URL of the REST API.
+        stac_url (str): The base URL of the public STAC catalog.
+        timeout (float): The timeout of a request in seconds.
+        retries (int): The number of times a throttled or failed request is retried.
+    '''
+    def __init__(self, session, api_url=API_URL, stac_url=STAC_URL, timeout=60, retries=3):
+        self.session = session
+        self.api_url = api_url.rstrip('/')
+        self.stac_url = stac_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+
+    def request(self, method, url, authorize=True, **kwargs):
+        ''' Makes a request, retrying throttled requests and refreshing rejected tokens.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to request.
+            authorize (bool): Whether to send the session's bearer token.
+            kwargs: Passed on to requests (ex: params, json).
+
+        Returns: The successful requests.Response.
+        '''
+        token = (self.session.cached_token or self.session.access_token()) if authorize else None
+        limiter = getattr(self.session, 'limiter', None)
+        for attempt in range(self.retries + 1):
+            headers = dict(Authorization=f'Bearer {token}') if token else {}
+            if limiter is not None and authorize:
+                limiter.wait()
+            response = self.session.http.request(method, url, headers=headers,
+                                                 timeout=self.timeout, **kwargs)
+            if response.status_code < 400:
+                return response
+            if attempt < self.retries:
+                if response.status_code == 401 and authorize:
+                    token = self.session.access_token(token)
+                    continue
+                if response.status_code in RETRY_STATUSES:
+                    time.sleep(2**attempt / 2)
+                    continue
+            raise ClientError(f'{response.status_code} {url}: {response.text}',
+                              response.status_code)
+        raise ClientError(f'Request failed: {url}')
+
+    def get_json(self, url, params=None, authorize=True):
+        ''' Gets a JSON response.
+
+        Args:
+            url (str): The URL to get.
+            params (dict): Optional; the query parameters.
+            authorize (bool): Whether to send the session's bearer token.
+
+        Returns: The decoded JSON response.
+        '''
+        return self.request('GET', url, params=params, authorize=authorize).json()
+
+    def get_asset(self, asset):
+        ''' Gets the metadata of an asset, as ee.data.getAsset.
+
+        Args:
+            asset (str): The asset ID.
+
+        Returns: A dictionary of the metadata.
+        '''
+        return self.get_json(f'{self.api_url}/{asset_name(asset)}')
+
+    def list_images(self, parameters):
+        ''' Lists images of a collection.
+
+        Args:
+            parameters (dict): The listImages parameters; parent is the collection asset name.
+
+        Returns: A generated list of image metadata. If the parent is an image instead of a
+            collection, the image itself is generated.
+        '''
+        parameters = dict(parameters)
+        url = f'{self.api_url}/{parameters.pop("parent")}:listImages'
+        params = {key: str(value) for (key, value) in parameters.items()}
+        while True:
+            try:
+                response = self.get_json(url, params=params)
+            except ClientError as error:
+                if error.args[0].find('is not an image collection.') != -1:
+                    yield self.get_json(url[:-len(':listImages')])
+                    return
+                raise error
+            for image in response.get('images', []):
+                yield image
+            if 'pageSize' in parameters or not response.get('nextPageToken'):
+                return
+            params.update(pageToken=response['nextPageToken'])
+
+    def list_assets(self, parent):
+        ''' Lists the assets in a folder, as ee.data.listAssets.
+
+        Args:
+            parent (str): The folder asset ID (ex: LANDSAT/LC08/C01).
+
+        Returns: A generated list of asset metadata, with name, id and type fields.
+        '''
+        url = f'{self.api_url}/{asset_name(parent)}:listAssets'
+        params = {}
+        while True:
+            response = self.get_json(url, params=params)
+            for asset in response.get('assets', []):
+                yield asset
+            if not response.get('nextPageToken'):
+                return
+            params.update(pageToken=response['nextPageToken'])
+
+    def get_stac_metadata(self, asset):
+        ''' Gets STAC metadata of an asset from the public catalog.
+
+        Args:
+            asset (str): The asset ID.
+
+        Returns: A dictionary of the metadata.
+        '''
+        return self.get_json(f'{self.stac_url}/{asset.replace("/", "_")}.json', authorize=False)
+
+class FailoverClient(Client):
+    ''' A client for a pool of sessions, moving to another session when one is throttled.
+
+    Attributes:
+        sessions (odc_gee.earthengine.SessionPool): The pool the sessions are taken from.
+        key: The shard key the pool assigns a session by.
+        session (odc_gee.earthengine.Session): The session currently making requests.
+    '''
+    def __init__(self, sessions, key=None, **kwargs):
+        self.sessions = sessions
+        self.key = key
+        super().__init__(sessions.get(key), **kwargs)
+
+    def request(self, method, url, authorize=True, **kwargs):
+        ''' Makes a request as Client.request, failing over to the next session of the pool
+        while requests stay throttled after retrying.
+        '''
+        for _ in range(len(self.sessions) - 1):
+            try:
+                return super().request(method, url, authorize=authorize, **kwargs)
+            except ClientError as error:
+                if error.status != 429:
+                    raise error
+                self.sessions.throttled(self.session)
+                self.session = self.sessions.get(self.key)
+        return super().request(method, url, authorize=authorize, **kwargs)
+
+class AsyncClient:
+    ''' An asyncio client for Earth Engine listing and metadata calls.
+
+    Use the client as an async context manager, which opens and closes its connection pool:
+
+        async with AsyncClient(datacube.session) as client:
+            asset = await client.get_asset('LANDSAT/LC08/C01/T1_SR')
+
+    Attributes:
+        session (odc_gee.earthengine.Session): The session authorizing requests.
+        api_url (str): The base URL of the REST API.
+        stac_url (str): The base URL of the public STAC catalog.
+        limit (int): The maximum number of open connections.
+        timeout (float): The total timeout of a request in seconds.
+        retries (int): The number of times a throttled or failed request is retried.
+    '''
+    def __init__(self, session, api_url=API_URL, stac_url=STAC_URL,
+                 limit=100, timeout=60, retries=3):
+        self.session = session
+        self.api_url = api_url.rstrip('/')
+        self.stac_url = stac_url.rstrip('/')
+        self.limit = limit
+        self.timeout = timeout
+        self.retries = retries
+        self._http = None
+
+    async def __aenter__(self):
+        import aiohttp
+        self._http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.limit),
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._http.close()
+        self._http = None
+
+    async def _token(self, stale=None):
+        token = None if stale else self.session.cached_token
+        if token is None:
+            # Refreshing credentials blocks, so it runs off the event loop
+            loop = asyncio.get_event_loop()
+            token = await loop.run_in_executor(None, self.session.access_token, stale)
+        return token
+
+    async def get_json(self, url, params=None, authorize=True):
+        ''' Gets a JSON response, retrying throttled requests and refreshing rejected tokens.
+
+        Args:
+            url (str): The URL to get.
+            params (dict): Optional; the query parameters.
+            authorize (bool): Whether to send the session's bearer token.
+
+        Returns: The decoded JSON response.
+        '''
+        if self._http is None:
+            raise RuntimeError('AsyncClient must be used as an async context manager.')
+        token = await self._token() if authorize else None
+        for attempt in range(self.retries + 1):
+            headers = dict(Authorization=f'Bearer {token}') if token else {}
+            if getattr(self.session, 'limiter', None) is not None and authorize:
+                await asyncio.sleep(self.session.limiter.reserve())
+            async with self._http.get(url, params=params, headers=headers) as response:
+                if response.status < 400:
+                    return await response.json(content_type=None)
+                message = await response.text()
+                if attempt < self.retries:
+                    if response.status == 401 and authorize:
+                        token = await self._token(stale=token)
+                        continue
+                    if response.status in RETRY_STATUSES:
+                        await asyncio.sleep(2**attempt / 2)
+                        continue
+                raise ClientError(f'{response.status} {url}: {message}', response.status)
+        raise ClientError(f'Request failed: {url}')
+
+    async def get_asset(self, asset):
+        ''' Gets the metadata of an asset, as ee.data.getAsset.
+
+        Args:
+            asset (str): The asset ID.
+
+        Returns: A dictionary of the metadata.
+        '''
+        return await self.get_json(f'{self.api_url}/{asset_name(asset)}')
+
+    async def list_images(self, parameters):
+        ''' Lists images of a collection, as Datacube.get_images.
+
+        Args:
+            parameters (dict): The listImages parameters; parent is the collection asset name.
+
+        Returns: An async generator of image metadata. If the parent is an image instead of a
+            collection, the image itself is generated.
+        '''
+        parameters = dict(parameters)
+        url = f'{self.api_url}/{parameters.pop("parent")}:listImages'
+        params = {key: str(value) for (key, value) in parameters.items()}
+        while True:
+            try:
+                response = await self.get_json(url, params=params)
+            except ClientError as error:
+                if error.args[0].find('is not an image collection.') != -1:
+                    yield await self.get_json(url[:-len(':listImages')])
+                    return
+                raise error
+            for image in response.get('images', []):
+                yield image
+            if 'pageSize' in parameters or not response.get('nextPageToken'):
+                return
+            params.update(pageToken=response['nextPageToken'])
+
+    async def list_assets(self, parent):
+        ''' Lists the assets in a folder, as Client.list_assets.
+
+        Args:
+            parent (str): The folder asset ID (ex: LANDSAT/LC08/C01).
+
+        Returns: An async generator of asset metadata, with name, id and type fields.
+        '''
+        url = f'{self.api_url}/{asset_name(parent)}:listAssets'
+        params = {}
+        while True:
+            response = await self.get_json(url, params=params)
+            for asset in response.get('assets', []):
+                yield asset
+            if not response.get('nextPageToken'):
+                return
+            params.update(pageToken=response['nextPageToken'])
+
+    async def get_stac_metadata(self, asset):
+        ''' Gets STAC metadata of an asset from the public catalog, as Datacube.get_stac_metadata.
+
+        Args:
+            asset (str): The asset ID.
+
+        Returns: A dictionary of the metadata.
+        '''
+        return await self.get_json(f'{self.stac_url}/{asset.replace("/", "_")}.json',
+                                   authorize=False)
+
+class ThreadedClient:
+    ''' The AsyncClient interface over a blocking Client, running its calls in a thread pool.
+
+    Used in place of AsyncClient when aiohttp is not installed. Listings are paged lazily, one
+    page per call, as with AsyncClient.
+
+    Attributes:
+        client (Client): The client making the requests.
+        limit (int): The most calls running at once.
+    '''
+    def __init__(self, client, limit=32):
+        self.client = client
+        self.limit = limit
+        self._executor = None
+
+    async def __aenter__(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.limit)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+    async def _run(self, function, *args):
+        if self._executor is None:
+            raise RuntimeError('ThreadedClient must be used as an async context manager.')
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    async def _iterate(self, generator):
+        done = object()
+        while True:
+            item = await self._run(next, generator, done)
+            if item is done:
+                return
+            yield item
+
+    async def get_asset(self, asset):
+        ''' Gets the metadata of an asset, as Client.get_asset. '''
+        return await self._run(self.client.get_asset, asset)
+
+    async def list_images(self, parameters):
+        ''' Lists images of a collection, as Client.list_images. '''
+        async for image in self._iterate(self.client.list_images(parameters)):
+            yield image
+
+    async def list_assets(self, parent):
+        ''' Lists the assets in a folder, as Client.list_assets. '''
+        async for asset in self._iterate(self.client.list_assets(parent)):
+            yield asset
+
+    async def get_stac_metadata(self, asset):
+        ''' Gets STAC metadata of an asset, as Client.get_stac_metadata. '''
+        return await self._run(self.client.get_stac_metadata, asset)
@@ -1,68 +1,417 @@
 # pylint: disable=import-error,invalid-name,protected-access
 """ Module for Google Earth Engine tools. """
+from contextlib import contextmanager
+from functools import lru_cache
 from importlib import import_module
 from pathlib import Path
+import json
 import os
-import weakref
+import threading
+import time
+import zlib
 
-from rasterio.errors import RasterioIOError
 import numpy
 
-from datacube.api.query import Query
 import datacube
 
+from odc_gee.client import AsyncClient, Client, FailoverClient, RateLimiter, ThreadedClient,\
+                           asset_id, asset_name
+from odc_gee.footprints import FootprintCache, bounds_region
+
 HOME = os.getenv('HOME')
 CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS',
                         f'{HOME}/.config/odc-gee/credentials.json')
+# The listImages response fields read when parsing and indexing images
+IMAGE_FIELDS = 'images(name,startTime,updateTime,geometry,bands(id,grid)),nextPageToken'
+# ODC query fields that are filtered server-side and the GEE image properties they map to
+FILTER_PROPERTIES = dict(cloud_cover=['CLOUD_COVER', 'CLOUDY_PIXEL_PERCENTAGE'],
+                         instrument_mode=['instrumentMode'],
+                         orbit_direction=['orbitProperties_pass'],
+                         relative_orbit=['relativeOrbitNumber_start'])
+# ODC query fields whose values are spelled differently in GEE, with the (property, value)
+# each normalized ODC value matches. GEE compares strings exactly, so values without a
+# mapping are not filtered server-side.
+FILTER_VALUES = dict(platform={'landsat_4': ('SPACECRAFT_ID', 'LANDSAT_4'),
+                               'landsat_5': ('SPACECRAFT_ID', 'LANDSAT_5'),
+                               'landsat_7': ('SPACECRAFT_ID', 'LANDSAT_7'),
+                               'landsat_8': ('SPACECRAFT_ID', 'LANDSAT_8'),
+                               'landsat_9': ('SPACECRAFT_ID', 'LANDSAT_9'),
+                               'sentinel_1a': ('platform_number', 'A'),
+                               'sentinel_1b': ('platform_number', 'B'),
+                               'sentinel_2a': ('SPACECRAFT_NAME', 'Sentinel-2A'),
+                               'sentinel_2b': ('SPACECRAFT_NAME', 'Sentinel-2B')},
+                     instrument={'tm': ('SENSOR_ID', 'TM'),
+                                 'etm': ('SENSOR_ID', 'ETM'),
+                                 'oli_tirs': ('SENSOR_ID', 'OLI_TIRS'),
+                                 'sar': ('instrument', 'Synthetic Aperture Radar')})
+
+class Session:
+    ''' An authorized Earth Engine session for one set of credentials.
+
+    Sessions are shared: Session.get returns the same session for the same credentials, so
+    every Datacube and thread using those credentials authorizes once. Credentials are
+    refreshed under a lock and handed to GDAL as thread-scoped configuration options
+    instead of process environment variables. Token refreshes, REST API calls and pixel
+    reads share one pooled, keep-alive HTTP session.
+
+    Attributes:
+        credentials: The credentials file path or the authorized credentials object.
+        request: The Request object used to refresh user credentials (None for service accounts).
+        key_file (str): The service account key file, if one is being used.
+        max_connections (int): The most connections kept open to each host. Requests beyond
+            the limit wait for a free connection.
+        retries (int): The number of times a throttled or failed REST API call is retried.
+        limiter (odc_gee.client.RateLimiter): Limits the rate of REST API calls made with
+            the session's credentials, if a rate was given.
+    '''
+    _sessions = {}
+    _sessions_lock = threading.Lock()
+    _ee_lock = threading.RLock()
+    _ee_active = None
+
+    def __init__(self, credentials=CREDENTIALS, max_connections=32, retries=3, rate=None):
+        self.credentials = credentials
+        self.request = None
+        self.key_file = None
+        self.max_connections = max_connections
+        self.retries = retries
+        self.rate = rate
+        self.limiter = RateLimiter(rate) if rate else None
+        self._ee = None
+        self._http = None
+        self._client = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def get(cls, credentials=CREDENTIALS, **kwargs):
+        ''' Gets the shared session for a set of credentials.
+
+        Args:
+            credentials: A credentials file path or a credentials object.
+            kwargs: Options (ex: max_connections) used if the session has to be created.
+
+        Returns: An odc_gee.earthengine.Session.
+
+        Raises:
+            ValueError: If the shared session was created with different options.
+        '''
+        key = credentials if isinstance(credentials, str) else id(credentials)
+        with cls._sessions_lock:
+            session = cls._sessions.get(key)
+            if session is None:
+                session = cls._sessions[key] = cls(credentials, **kwargs)
+            elif any(getattr(session, name) != value for (name, value) in kwargs.items()):
+                raise ValueError('The session for these credentials was created with different '
+                                 f'options than {kwargs}.')
+            return session
+
+    @property
+    def http(self):
+        ''' The pooled, keep-alive requests session shared by this session's HTTP calls. '''
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    import requests
+                    http = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_maxsize=self.max_connections,
+                                                            pool_block=True)
+                    http.mount('http://', adapter)
+                    http.mount('https://', adapter)
+                    self._http = http
+        return self._http
+
+    @property
+    def client(self):
+        ''' The odc_gee.client.Client making REST API calls over the pooled HTTP session. '''
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = Client(self, retries=self.retries)
+        return self._client
+
+    def _auth_request(self):
+        return import_module('google.auth.transport.requests').Request(session=self.http)
+
+    @property
+    def ee(self):
+        ''' The ee module, initialized with the session credentials on first use. '''
+        return self.initialize()
+
+    def initialize(self):
+        ''' Initializes Earth Engine with the session credentials if it has not been already.
+
+        Returns: The ee module.
+        '''
+        if self._ee is None:
+            with self._lock:
+                if self._ee is None:
+                    self._initialize_ee()
+        return self._ee
+
+    def _initialize_ee(self):
+        _ee = import_module('ee')
+        with Session._ee_lock:
+            if isinstance(self.credentials, str) and Path(self.credentials).is_file():
+                self.key_file = self.credentials
+                self.credentials = _ee.ServiceAccountCredentials('', key_file=self.key_file)
+                _ee.Initialize(self.credentials)
+            else:
+                _ee.Authenticate(auth_mode='paste')
+                _ee.Initialize()
+                self.credentials = _ee.data.get_persistent_credentials()
+                self.request = self._auth_request()
+                self.refresh()
+            Session._ee_active = self
+        self._ee = _ee
+
+    @contextmanager
+    def activate(self):
+        ''' A context manager making this session's credentials current for ee calls.
+
+        The ee client library keeps its credentials in module state, so calls that go
+        through it (ex: getInfo) hold a process-wide lock while they run.
+        '''
+        _ee = self.initialize()
+        with Session._ee_lock:
+            if Session._ee_active is not self:
+                _ee.Initialize(self.credentials)
+                Session._ee_active = self
+            yield self
+
+    def refresh(self, token=None):
+        ''' Refreshes user credentials.
+
+        Args:
+            token (str): Optional; the token that was rejected. If another thread has already
+                replaced it, the credentials are not refreshed again.
+
+        Returns: True if the credentials can be refreshed, False otherwise.
+        '''
+        if not self.request:
+            return False
+        with self._lock:
+            if token is None or self.credentials.token == token:
+                self.credentials.refresh(self.request)
+        return True
+
+    def access_token(self, stale=None):
+        ''' Gets a valid access token, refreshing the credentials when they have expired.
+
+        Args:
+            stale (str): Optional; a token that was rejected. It is replaced unless another
+                thread has already replaced it.
+
+        Returns: The access token.
+        '''
+        self.initialize()
+        with self._lock:
+            if not self.credentials.valid\
+               or (stale is not None and self.credentials.token == stale):
+                self.credentials.refresh(self.request or self._auth_request())
+            return self.credentials.token
+
+    @property
+    def cached_token(self):
+        ''' The access token if it is still valid, or None if getting one would block. '''
+        if self._ee is not None and self.credentials.valid:
+            return self.credentials.token
+        return None
+
+    @property
+    def gdal_options(self):
+        ''' The GDAL configuration options authorizing EEDAI reads with this session. '''
+        self.initialize()
+        if self.key_file:
+            return dict(GOOGLE_APPLICATION_CREDENTIALS=self.key_file)
+        with self._lock:
+            return dict(EEDA_BEARER=self.credentials.token)
+
+    def close(self):
+        ''' Closes the pooled HTTP connections and removes the session from the shared pool. '''
+        with Session._sessions_lock:
+            for key, session in list(Session._sessions.items()):
+                if session is self:
+                    Session._sessions.pop(key)
+        with self._lock:
+            if self._http is not None:
+                self._http.close()
+                self._http = None
+
+class SessionPool:
+    ''' Sessions for several sets of credentials, sharing work between their quotas.
+
+    Work is assigned to a session by a stable hash of a shard key (ex: the asset and region
+    of a query), so a product, region or tile keeps using the same account. Each session
+    keeps its own token and rate limiter. A throttled session is skipped for a cooldown and
+    its work fails over to the next session of the pool.
+
+    Attributes:
+        sessions (list): The sessions, one per set of credentials.
+        cooldown (float): The seconds a throttled session is skipped for.
+        retries (int): The number of times a throttled request is retried before failing over.
+    '''
+    def __init__(self, credentials, cooldown=60, retries=1, **kwargs):
+        self.sessions = [Session.get(_credentials, **kwargs) for _credentials in credentials]
+        if not self.sessions:
+            raise ValueError('At least one set of credentials is required.')
+        self.cooldown = cooldown
+        self.retries = retries
+        self._throttled = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, key=None):
+        ''' Gets the session assigned to a shard key.
+
+        Args:
+            key: Optional; the shard key. Any value with a stable string form.
 
-class Singleton(type):
-    ''' A Singleton metaclass. '''
-    __instance = None
+        Returns: The assigned session, or the next one that is not cooling down. If every
+            session is cooling down, the one that cools down first.
+        '''
+        start = zlib.crc32(str(key).encode()) % len(self.sessions)
+        order = self.sessions[start:] + self.sessions[:start]
+        now = time.monotonic()
+        with self._lock:
+            for session in order:
+                if self._throttled.get(id(session), 0) <= now:
+                    return session
+            return min(order, key=lambda session: self._throttled[id(session)])
+
+    def throttled(self, session):
+        ''' Marks a session as throttled, so work fails over from it until it cools down. '''
+        with self._lock:
+            self._throttled[id(session)] = time.monotonic() + self.cooldown
+
+    def client(self, key=None):
+        ''' Gets a client for a shard key that fails over between the pool's sessions.
+
+        Args:
+            key: Optional; the shard key.
+
+        Returns: An odc_gee.client.FailoverClient.
+        '''
+        return FailoverClient(self, key, retries=self.retries)
+
+class Pool(type):
+    ''' A metaclass sharing one instance per set of construction arguments. '''
     def __init__(cls, *args, **kwargs):
-        super(Singleton, cls).__init__(*args, **kwargs)
+        super(Pool, cls).__init__(*args, **kwargs)
+        cls._instances = {}
+        cls._instances_lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
-        if cls.__instance is None:
-            cls.__instance = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls.__instance
+        try:
+            key = (args, tuple(sorted(kwargs.items())))
+            hash(key)
+        except TypeError:
+            return super(Pool, cls).__call__(*args, **kwargs)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                instance = super(Pool, cls).__call__(*args, **kwargs)
+                instance._pool_key = key
+                cls._instances[key] = instance
+            return cls._instances[key]
+
+    def release(cls, instance):
+        ''' Removes an instance from the pool. '''
+        with cls._instances_lock:
+            if cls._instances.get(getattr(instance, '_pool_key', None)) is instance:
+                cls._instances.pop(instance._pool_key)
 
-class Datacube(datacube.Datacube, metaclass=Singleton):
+class Datacube(datacube.Datacube, metaclass=Pool):
     ''' Extended Datacube object for use with Google Earth Engine.
 
+    Constructing a Datacube with the same arguments (credentials, config, env, app) returns
+    the same instance and reuses its index connection; different arguments get separate
+    instances. Instances are safe to share between threads.
+
+    Pass a list or tuple of credentials (ex: service account key files) to share work between
+    the quotas of several accounts. REST API calls and reads are then sharded between their
+    sessions by asset and region, and fail over to another account when one is throttled.
+    A rate limits the REST API calls made with each set of credentials (calls per second).
+    Sessions are shared per set of credentials, so a rate different from the one an existing
+    session was created with raises a ValueError.
+
     Attributes:
-        credentials: The Earth Engine credentials being used for the API session.
-        request: The Request object used in the session.
-        ee: A reference to the ee (earthengine-api) module.
+        session (Session): The Earth Engine session for the credentials being used. With
+            several credentials, the session of the first is used for ee calls.
+        sessions (SessionPool): The sessions of several credentials, or None.
+        footprints (odc_gee.footprints.FootprintCache): The local index of listed images that
+            load and sample_points select candidate images from, or None (the default) to
+            list every query through the API. Enable it with the footprints argument: True
+            for the default directory (ODC_GEE_FOOTPRINTS or ~/.cache/odc-gee/footprints), a
+            directory path, or a FootprintCache (ex: with a shorter latency). Time ranges not
+            yet listed for a query are requested from the API and added to it; ranges more
+            recent than the cache latency are always listed again. Call footprints.clear()
+            to list everything again (ex: after images were added to a collection late).
+        ee: A reference to the ee (earthengine-api) module. Earth Engine is initialized and the
+            credentials are authorized on first access, not when the Datacube is created.
     '''
-    def __init__(self, *args, **kwargs):
-        self.ee = import_module('ee')
-        if not hasattr(self, 'request') or not hasattr(self, 'credentials'):
-            self.request = None
-            self.credentials = kwargs.pop('credentials', CREDENTIALS)
-        if isinstance(self.credentials, str) and Path(self.credentials).is_file():
-            os.environ.update(GOOGLE_APPLICATION_CREDENTIALS=self.credentials)
-            self.credentials = self.ee.ServiceAccountCredentials('',
-                                                                 key_file=self.credentials)
-            self.ee.Initialize(self.credentials)
-        else:
-            if not self.request:
-                self.ee.Authenticate(auth_mode='paste')
-                self.ee.Initialize()
-            self.credentials = self.ee.data.get_persistent_credentials()
-            self.request = import_module('google.auth.transport.requests').Request()
-            self._refresh_credentials()
-        self._finalizer = weakref.finalize(self, cleanup, 'EEDA_BEARER', self.request)
+    def __init__(self, *args, credentials=CREDENTIALS, session=None, rate=None, footprints=None,
+                 **kwargs):
+        self.sessions = None
+        options = dict(rate=rate) if rate is not None else {}
+        if session is None and isinstance(credentials, (list, tuple)):
+            self.sessions = SessionPool(credentials, **options)
+            session = self.sessions.sessions[0]
+        self.session = session if session is not None else Session.get(credentials, **options)
+        if footprints is True:
+            footprints = FootprintCache()
+        elif isinstance(footprints, str):
+            footprints = FootprintCache(footprints)
+        self.footprints = footprints or None
+        self._removed = False
         super().__init__(*args, **kwargs)
 
+    @property
+    def ee(self):
+        ''' The ee module, initialized with the session credentials on first use. '''
+        return self.session.ee
+
+    @property
+    def credentials(self):
+        ''' The Earth Engine credentials being used for the API session. '''
+        return self.session.credentials
+
+    @property
+    def request(self):
+        ''' The Request object used in the session. '''
+        return self.session.request
+
+    def shard(self, key=None):
+        ''' Gets the session assigned to a shard key.
+
+        Args:
+            key: Optional; the shard key (ex: from shard_key).
+
+        Returns: The assigned session from the pool, or the Datacube's session.
+        '''
+        return self.sessions.get(key) if self.sessions else self.session
+
+    def client(self, key=None):
+        ''' Gets a REST API client for a shard key.
+
+        Args:
+            key: Optional; the shard key (ex: from shard_key).
+
+        Returns: An odc_gee.client.FailoverClient over the pool, or the session's Client.
+        '''
+        return self.sessions.client(key) if self.sessions else self.session.client
+
     def remove(self):
-        ''' Finalizer to cleanup sensitive data. '''
-        self._finalizer()
+        ''' Removes the Datacube from the pool and closes its index connection. '''
+        if not self._removed:
+            type(self).release(self)
+            self.close()
+            self._removed = True
 
     @property
     def removed(self):
-        ''' Property to check if object has been finalized. '''
-        return not self._finalizer.alive
-
+        ''' Property to check if object has been removed. '''
+        return self._removed
 
     def load(self, *args, **kwargs):
         ''' An overloaded load function from Datacube.
@@ -73,9 +422,23 @@ class Datacube(datacube.Datacube, metaclass=Singleton):
         Args:
             asset (str): The asset ID of the GEE collection or image being queried. If not included
                 then the load will default to normal Datacube operation.
+            driver: Optional; how GEE pixels are read. By default they are read through GDAL's
+                EEDAI driver. 'pixels' (or an odc_gee.pixels.PixelReader) requests blocks from
+                the REST API directly. The pixels driver does not support dask_chunks,
+                resampling, fuse_func, skip_broken_datasets or progress_cbk.
+            footprints: Optional; the odc_gee.footprints.FootprintCache answering image
+                listings locally, or False to list every query through the API. Defaults to
+                the Datacube's footprints cache, which is off unless it was enabled.
 
         Returns: The queried xarray.Dataset.
         '''
+        from datacube.api.query import Query
+        from rasterio.errors import RasterioIOError
+        import rasterio
+        gdal_options = {}
+        session = self.session
+        driver = kwargs.pop('driver', None)
+        footprints = kwargs.pop('footprints', self.footprints)
         try:
             query = Query(**kwargs)
             if query.product and not isinstance(query.product,
@@ -90,16 +453,28 @@ class Datacube(datacube.Datacube, metaclass=Singleton):
                 if kwargs.get('query'):
                     kwargs.pop('query')
                 parameters = self.build_parameters(query)
-                images = self.get_images(parameters)
+                session = self.shard(shard_key(parameters))
+                if footprints:
+                    images = footprints.list_images(dict(parameters, fields=IMAGE_FIELDS),
+                                                    self.get_images)
+                else:
+                    images = self.get_images(parameters)
                 kwargs.update(datasets=get_datasets(asset=query.asset,
                                                     images=images,
-                                                    product=query.product))
-                datasets = super().load(*args, **kwargs)
+                                                    product=query.product,
+                                                    measurements=kwargs.get('measurements')))
+                if driver is not None:
+                    return self._load_pixels(driver, *args, session=session, **kwargs)
+                gdal_options = session.gdal_options
+                with rasterio.Env(**gdal_options):
+                    datasets = super().load(*args, **kwargs)
+                if kwargs.get('dask_chunks') is not None:
+                    datasets = with_gdal_options(datasets, gdal_options)
             else:
                 return super().load(*args, **kwargs)
         except RasterioIOError as error:
             if error.args[0].find('"UNAUTHENTICATED"') != -1:
-                if self._refresh_credentials():
+                if session.refresh(gdal_options.get('EEDA_BEARER')):
                     return self.load(*args, **kwargs)
                 raise error
         except Exception as error:
@@ -107,41 +482,201 @@ class Datacube(datacube.Datacube, metaclass=Singleton):
         else:
             return datasets
 
-    def _refresh_credentials(self):
-        if self.request:
-            self.credentials.refresh(self.request)
-            os.environ.update(EEDA_BEARER=self.credentials.token)
-            return True
-        return False
+    def _load_pixels(self, driver, *args, session=None, datasets=None, measurements=None,
+                     like=None, output_crs=None, resolution=None, align=None, dask_chunks=None,
+                     **query):
+        from datacube.api.core import output_geobox
+        from datacube.api.query import query_group_by
+        from odc_gee.pixels import PixelReader
+        if dask_chunks is not None:
+            raise ValueError('The pixels driver does not support dask_chunks.')
+        unsupported = [name for name in ('resampling', 'fuse_func', 'skip_broken_datasets',
+                                         'progress_cbk')
+                       if query.pop(name, None) not in (None, False)]
+        if unsupported:
+            raise ValueError(f'The pixels driver does not support: {", ".join(unsupported)}.')
+        if driver == 'pixels':
+            reader = PixelReader(session or self.session)
+        elif isinstance(driver, PixelReader):
+            reader = driver
+        else:
+            raise ValueError(f'Unknown driver: {driver}')
+
+        datasets = list(datasets)
+        if not datasets:
+            import xarray
+            return xarray.Dataset()
+        product = datasets[0].type
+        geobox = output_geobox(like=like, output_crs=output_crs, resolution=resolution,
+                               align=align, grid_spec=product.grid_spec,
+                               datasets=datasets, **query)
+        grouped = self.group_datasets(datasets, query_group_by(**query))
+        measurements = list(product.lookup_measurements(measurements).values())
+        data = self.create_storage(grouped.coords, geobox, measurements)
 
-    def get_images(self, parameters):
+        # Footprints in the output CRS, outside of which getPixels returns zeros
+        sources = [(index, [({measurement.name: dataset.measurements[measurement.name]['path']
+                              for measurement in measurements
+                              if measurement.name in dataset.measurements},
+                             dataset.extent.to_crs(geobox.crs).json
+                             if dataset.extent is not None else None)
+                            for dataset in group])
+                   for (index, group) in numpy.ndenumerate(grouped.values)]
+        outputs = {measurement.name: (data[measurement.name].values, measurement.nodata)
+                   for measurement in measurements}
+        reader.read(sources, geobox.transform, geobox.crs, outputs)
+        return data
+
+    def sample_points(self, points, product=None, asset=None, measurements=None,
+                      tile_size=1.0, reader=None, **query):
+        ''' Samples time series of pixel values at many points.
+
+        Points are grouped into tiles and images are listed once per tile. Only the pixels
+        under the points are read, with one getPixels request per image and block of points.
+
+        Args:
+            points (geopandas.GeoDataFrame): The points to sample.
+            product (str): The name of an indexed product to sample.
+            asset (str): The asset ID to sample, if a product name is not given.
+            measurements (list): Optional; the measurements to sample. Defaults to all.
+            tile_size (float): The width and height of the tiles in degrees.
+            reader (odc_gee.pixels.PixelReader): Optional; the reader to use.
+            query: Further search terms (ex: time, cloud_cover).
+
+        Returns: A pandas.DataFrame with a row per point and image, holding the point's index
+            label, the image time and name, and a column per measurement.
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        from datacube.api.query import Query
+        from shapely.geometry import Point, shape
+        from shapely.prepared import prep
+        import pandas
+        from odc_gee.pixels import PixelReader
+
+        if product is not None:
+            product = self.index.products.get_by_name(product)
+            asset = product.metadata_doc['properties']['gee:asset']
+        else:
+            product = self.generate_product(asset=asset)
+        names = [measurement.name for measurement
+                 in product.lookup_measurements(measurements).values()]
+        if points.crs is not None and points.crs != 'EPSG:4326':
+            points = points.to_crs('EPSG:4326')
+        lons, lats = points.geometry.x.values, points.geometry.y.values
+        reader = reader if reader is not None else PixelReader(self.shard(asset))
+
+        query = Query(**query)
+        query.asset = asset
+        tiles = numpy.floor(numpy.stack([lons, lats], axis=1) / tile_size)
+        tiles, groups = numpy.unique(tiles, axis=0, return_inverse=True)
+        jobs = []
+        for (tile, (x, y)) in enumerate(tiles):
+            members = numpy.flatnonzero(groups.ravel() == tile)
+            # Listed by tile, so the footprint index covers the whole tile for later queries
+            parameters = dict(self.build_parameters(query),
+                              region=bounds_region((x * tile_size, y * tile_size,
+                                                    (x + 1) * tile_size, (y + 1) * tile_size)))
+            if self.footprints:
+                images = self.footprints.list_images(dict(parameters, fields=IMAGE_FIELDS),
+                                                     self.get_images)
+            else:
+                images = self.get_images(parameters)
+            for image in images:
+                footprint = prep(shape(image['geometry']))
+                inside = members[[footprint.intersects(Point(lons[i], lats[i]))
+                                  for i in members]]
+                if len(inside):
+                    jobs.append((image, inside))
+
+        def sample(image, inside):
+            bands = {}
+            for (name, band) in zip(product.measurements, image['bands']):
+                if name in names:
+                    grid = json.dumps(band['grid'], sort_keys=True)
+                    bands.setdefault(grid, []).append((name, band['id']))
+            table = pandas.DataFrame(dict(point=points.index[inside],
+                                          time=pandas.Timestamp(image['startTime']),
+                                          image=image['name']))
+            for (grid, grid_bands) in bands.items():
+                values = reader.sample(image['name'], [band for (_, band) in grid_bands],
+                                       json.loads(grid), lons[inside], lats[inside])
+                for (name, band) in grid_bands:
+                    table[name] = values[band]
+            return table
+
+        with ThreadPoolExecutor(max_workers=reader.workers) as executor:
+            tables = list(executor.map(lambda job: sample(*job), jobs))
+        if not tables:
+            return pandas.DataFrame(columns=['point', 'time', 'image'] + names)
+        return pandas.concat(tables, ignore_index=True)\
+                     .sort_values(['point', 'time'], kind='stable').reset_index(drop=True)
+
+    def get_images(self, parameters, fields=IMAGE_FIELDS):
         ''' Gets the images or image from the GEE REST API.
 
         Args:
             parameters (dict): The parameters to use for the REST API query.
+            fields (str): Optional; a field mask limiting the image metadata in the response.
+                Defaults to IMAGE_FIELDS, the fields used to parse and index images. Use None
+                for full image resources. A fields entry in the parameters takes precedence.
 
         Returns: The response from the API.
         '''
+        if fields and 'fields' not in parameters:
+            parameters = dict(parameters, fields=fields)
+        return self.client(shard_key(parameters)).list_images(parameters)
+
+    def count_images(self, parameters):
+        ''' Counts the images matching a query without building any documents.
+
+        Only image names are requested, which keeps responses small.
+
+        Args:
+            parameters (dict): The parameters to use for the REST API query.
+
+        Returns: The number of images.
+        '''
+        return sum(1 for _ in self.get_images(parameters, fields='images(name),nextPageToken'))
+
+    def async_client(self, key=None, **kwargs):
+        ''' Creates an asyncio client authorized by this Datacube's session.
+
+        Without aiohttp, the calls of the Datacube's blocking client run in a thread pool.
+
+        Args:
+            key: Optional; a shard key choosing the session from the pool of credentials.
+            kwargs: Options passed to odc_gee.client.AsyncClient (ex: limit, retries). Only the
+                limit is used without aiohttp.
+
+        Returns: An odc_gee.client.AsyncClient, or an odc_gee.client.ThreadedClient without
+            aiohttp, to be used as an async context manager.
+        '''
         try:
-            request = self.ee.data._get_cloud_api_resource().projects().assets().listImages(
-                **parameters)
-            while request is not None:
-                response = self.ee.data._execute_cloud_call(request)
-                request = self.ee.data._cloud_api_resource.projects().assets().listImages_next(
-                    request, response)
-                for image in response.get('images', []):
+            import_module('aiohttp')
+        except ImportError:
+            return ThreadedClient(self.client(key), limit=kwargs.get('limit', 32))
+        return AsyncClient(self.shard(key), **kwargs)
+
+    async def aget_images(self, parameters, client=None, fields=IMAGE_FIELDS):
+        ''' Gets the images or image from the GEE REST API with the asyncio client.
+
+        Args:
+            parameters (dict): The parameters to use for the REST API query.
+            client (odc_gee.client.AsyncClient): Optional; an open client to use. A new one is
+                opened for the call otherwise.
+            fields (str): Optional; a field mask, as for get_images.
+
+        Returns: An async generator of the images in the response.
+        '''
+        if fields and 'fields' not in parameters:
+            parameters = dict(parameters, fields=fields)
+        if client is None:
+            async with self.async_client(shard_key(parameters)) as client:
+                async for image in client.list_images(parameters):
                     yield image
-                if 'pageSize' in parameters:
-                    break
-        except self.ee.EEException as error:
-            if error.args[0].find('is not an image collection.') != -1:
-                parameters = dict(name=parameters['parent'])
-                request = self.ee.data._get_cloud_api_resource().projects().assets().get(
-                    **parameters)
-                response = self.ee.data._execute_cloud_call(request)
-                yield response
-        except Exception as error:
-            raise error
+        else:
+            async for image in client.list_images(parameters):
+                yield image
 
     def build_parameters(self, query):
         ''' Build query parameters for GEE REST API from ODC queries.
@@ -152,21 +687,24 @@ class Datacube(datacube.Datacube, metaclass=Singleton):
         Returns:
             A formatted dictionary for a GEE query.
         '''
-        parameters = dict(parent=self.ee.data.convert_asset_id_to_asset_name(query.asset))
+        parameters = dict(parent=asset_name(query.asset))
         if query.geopolygon:
-            if query.geopolygon.type == 'Polygon':
-                parameters.update(
-                    region=self.ee.Geometry.Rectangle(
-                        coords=list(query.geopolygon.boundingbox)).getInfo())
-            elif query.geopolygon.type == 'Point':
-                parameters.update(
-                    region=self.ee.Geometry.Point(
-                        coords=list(query.geopolygon.boundingbox)[0:2]).getInfo())
+            geopolygon = query.geopolygon
+            if geopolygon.crs is not None and geopolygon.crs != 'EPSG:4326':
+                geopolygon = geopolygon.to_crs('EPSG:4326')
+            # Edges are straight lines in longitude and latitude, as in the ODC query
+            parameters.update(region=json.dumps(dict(geopolygon.json, geodesic=False)))
         if 'time' in query.search:
             parameters.update(startTime=query.search['time'].begin.strftime('%Y-%m-%dT%H:%M:%SZ'))
             parameters.update(endTime=query.search['time'].end.strftime('%Y-%m-%dT%H:%M:%SZ'))
+        filters = [build_filter(query.search)]
         if 'query' in query.search:
             parameters.update(**query.search['query'])
+            filters.append(query.search['query'].get('filter'))
+        filters = [_filter for _filter in filters if _filter]
+        if filters:
+            parameters.update(filter=' AND '.join(f'({_filter})' for _filter in filters)
+                              if len(filters) > 1 else filters[0])
         return parameters
 
     def generate_product(self, asset=None, name=None,
@@ -182,13 +720,158 @@ class Datacube(datacube.Datacube, metaclass=Singleton):
         Returns: A datacube.model.DatasetType product.
         '''
         stac_metadata = self.get_stac_metadata(asset)
-        metadata = self.ee.data.getAsset(asset)
-
-        name = name if name else metadata.get('id').split('/')[-1]
+        metadata = self.get_asset(asset)
         if kwargs.get('measurements') and not isinstance(kwargs['measurements'], (tuple, list)):
             measurements = kwargs['measurements']
         else:
             measurements = list(self.get_measurements(stac_metadata))
+        return self._product_from_metadata(asset, metadata, measurements,
+                                           name, resolution, output_crs)
+
+    async def agenerate_product(self, asset=None, name=None, resolution=None, output_crs=None,
+                                client=None, cache=None, **kwargs):
+        ''' Generates an ODC product from GEE asset metadata with the asyncio client.
+
+        The asset, STAC and first image metadata are fetched concurrently, and band types are
+        read from the image metadata instead of a separate getInfo call.
+
+        Args:
+            asset (str): The asset ID of the GEE image or image collection.
+            name (str): Optional; the product name.
+            resolution (tuple): Optional; the desired output resolution of the product.
+            output_crs (str): Optional; the desired CRS of the product.
+            client (odc_gee.client.AsyncClient): Optional; an open client to use. A new one is
+                opened for the call otherwise.
+            cache (dict): Optional; a dictionary caching the fetched metadata between calls.
+
+        Returns: A datacube.model.DatasetType product.
+        '''
+        import asyncio
+        if client is None:
+            async with self.async_client(asset) as client:
+                return await self.agenerate_product(asset, name, resolution, output_crs,
+                                                    client=client, cache=cache, **kwargs)
+
+        async def first_image():
+            async for image in client.list_images(dict(parent=asset_name(asset), pageSize=1)):
+                return image
+            return None
+
+        async def fetch():
+            return await asyncio.gather(client.get_stac_metadata(asset),
+                                        client.get_asset(asset),
+                                        first_image())
+
+        if cache is None:
+            stac_metadata, metadata, image = await fetch()
+        else:
+            # Concurrent calls for the same asset share one fetch
+            if asset not in cache:
+                cache[asset] = asyncio.ensure_future(fetch())
+            if isinstance(cache[asset], asyncio.Future):
+                cache[asset] = await cache[asset]
+            stac_metadata, metadata, image = cache[asset]
+        if kwargs.get('measurements') and not isinstance(kwargs['measurements'], (tuple, list)):
+            measurements = kwargs['measurements']
+        else:
+            band_types = {band['id']: get_band_type(band) for band in image['bands']}\
+                         if image else {}
+            measurements = list(self.get_measurements(stac_metadata, band_types=band_types))
+        return self._product_from_metadata(asset, metadata, measurements,
+                                           name, resolution, output_crs)
+
+    async def aexpand_assets(self, patterns, client):
+        ''' Expands asset ID patterns into the IDs of the assets they match.
+
+        Args:
+            patterns (list): Asset IDs, which may use fnmatch wildcards in any but the first
+                path segment (ex: LANDSAT/LC08/C01/T1_*).
+            client (odc_gee.client.AsyncClient): An open client to list folders with.
+
+        Returns: A list of unique asset IDs, in the order they were matched.
+        '''
+        from fnmatch import fnmatchcase
+        assets = []
+        for pattern in [patterns] if isinstance(patterns, str) else patterns:
+            segments = pattern.strip('/').split('/')
+            if any(char in segments[0] for char in '*?['):
+                raise ValueError(f'The first segment of {pattern} cannot be a wildcard.')
+            matches = [segments[0]]
+            for segment in segments[1:]:
+                if any(char in segment for char in '*?['):
+                    children = []
+                    for parent in matches:
+                        async for child in client.list_assets(parent):
+                            child = child.get('id') or asset_id(child['name'])
+                            if fnmatchcase(child.split('/')[-1], segment):
+                                children.append(child)
+                    matches = children
+                else:
+                    matches = [f'{parent}/{segment}' for parent in matches]
+            assets.extend(match for match in matches if match not in assets)
+        return assets
+
+    async def agenerate_products(self, assets, names=None, resolution=None, output_crs=None,
+                                 limit=16, client=None, cache=None):
+        ''' Generates ODC products for many GEE assets, fetching their metadata concurrently.
+
+        Args:
+            assets (list): Asset IDs or patterns, as aexpand_assets.
+            names (dict): Optional; product names by asset ID. Defaults to the last segment of
+                each asset ID.
+            resolution (tuple): Optional; the desired output resolution of the products.
+            output_crs (str): Optional; the desired CRS of the products.
+            limit (int): The most assets whose metadata is fetched at once.
+            client (odc_gee.client.AsyncClient): Optional; an open client to use.
+            cache (dict): Optional; a dictionary caching the fetched metadata between calls.
+
+        Returns: A list of datacube.model.DatasetType products, in the order of the assets.
+        '''
+        import asyncio
+        if client is None:
+            async with self.async_client(limit=limit * 3) as client:
+                return await self.agenerate_products(assets, names, resolution, output_crs,
+                                                     limit=limit, client=client, cache=cache)
+        names = names or {}
+        cache = {} if cache is None else cache
+        semaphore = asyncio.Semaphore(limit)
+
+        async def generate(asset):
+            async with semaphore:
+                return await self.agenerate_product(asset, names.get(asset), resolution,
+                                                    output_crs, client=client, cache=cache)
+
+        assets = await self.aexpand_assets(assets, client)
+        return list(await asyncio.gather(*[generate(asset) for asset in assets]))
+
+    def generate_products(self, assets, **kwargs):
+        ''' Generates ODC products for many GEE assets, as agenerate_products.
+
+        The asyncio calls run on their own event loop in a worker thread, so this can be
+        called from notebooks that already run an event loop.
+
+        Args:
+            assets (list): Asset IDs or patterns, as aexpand_assets.
+            kwargs: Options passed to agenerate_products (ex: names, resolution, output_crs).
+
+        Returns: A list of datacube.model.DatasetType products.
+        '''
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(self.agenerate_products(assets, **kwargs))
+            finally:
+                loop.close()
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(run).result()
+
+    def _product_from_metadata(self, asset, metadata, measurements,
+                               name=None, resolution=None, output_crs=None):
+        name = name if name else metadata.get('id').split('/')[-1]
         # TODO: find new method for platform and instrument property
         definition = dict(name=name,
                           description=metadata.get('properties').get('description'),
@@ -204,19 +887,25 @@ class Datacube(datacube.Datacube, metaclass=Singleton):
                                                            longitude=resolution[1])))
         return self.index.products.from_doc(definition)
 
-    def get_measurements(self, stac_metadata):
+    def get_measurements(self, stac_metadata, band_types=None):
         ''' Gets the measurements of a product from the GEE metadata.
 
         Args:
             stac_metadata (dict): The STAC metadata from GEE for the desired product.
+            band_types (dict): Optional; the band types by band name. They are queried from
+                the first image of the asset if not supplied.
 
         Returns: A generated list of datacube.model.Measurement objects.
         '''
         try:
-            band_types = self.ee.ImageCollection(stac_metadata['id']).first().bandTypes().getInfo()
+            if band_types is None:
+                with self.session.activate():
+                    band_types = self.ee.ImageCollection(
+                        stac_metadata['id']).first().bandTypes().getInfo()
         except self.ee.EEException as error:
             if error.args[0].find("found 'Image'") != -1:
-                band_types = self.ee.Image(stac_metadata['id']).bandTypes().getInfo()
+                with self.session.activate():
+                    band_types = self.ee.Image(stac_metadata['id']).bandTypes().getInfo()
         except Exception as error:
             raise error
         for band in stac_metadata['summaries'].get('eo:bands',
@@ -263,23 +952,150 @@ class Datacube(datacube.Datacube, metaclass=Singleton):
 
         Returns: A dictionary of the metadata.
         '''
-        url = f'gs://earthengine-stac/catalog/{asset.replace("/", "_")}.json'
-        blob = self.ee.Blob(url)
-        return self.ee.Dictionary(blob.string().decodeJSON()).getInfo()
+        return self.session.client.get_stac_metadata(asset)
+
+    def get_asset(self, asset):
+        ''' Gets the metadata of an asset in the GEE catalog.
+
+        Args:
+            asset (str): The asset ID.
+
+        Returns: A dictionary of the metadata.
+        '''
+        return self.client(asset).get_asset(asset)
+
+def shard_key(parameters):
+    ''' Gets the shard key of a listImages query, which assigns it to one of several accounts.
 
-def generate_documents(asset, images, product):
+    Args:
+        parameters (dict): The listImages parameters.
+
+    Returns: A string of the collection and region.
+    '''
+    return f'{parameters.get("parent")}|{parameters.get("region", "")}'
+
+def with_gdal_options(datasets, gdal_options):
+    ''' Makes the lazy reads of a dask-backed load run with GDAL configuration options.
+
+    Lazy reads run later on datacube IO threads, so the options of the load are carried by
+    each read task instead of the process-wide default rasterio configuration, which loads
+    using other credentials would replace. Only the read tasks (datacube.api.core.fuse_lazy)
+    are wrapped, in both the tuple and the Task graph formats of dask.
+
+    Args:
+        datasets (xarray.Dataset): The dask-backed Dataset returned by datacube.Datacube.load.
+        gdal_options (dict): The GDAL configuration options (ex: from Session.gdal_options).
+
+    Returns: The Dataset, with its dask arrays wrapping each read in the options.
+    '''
+    from functools import partial
+    from datacube.api.core import fuse_lazy
+    import dask.array
+    read = partial(_read_with_options, gdal_options, fuse_lazy)
+
+    def wrap(task):
+        if isinstance(task, tuple) and task and task[0] is fuse_lazy:
+            return (read, *task[1:])
+        if not isinstance(task, tuple) and getattr(task, 'func', None) is fuse_lazy:
+            return type(task)(task.key, read, *task.args, **task.kwargs)
+        return task
+
+    for name, variable in datasets.data_vars.items():
+        array = variable.data
+        if not isinstance(array, dask.array.Array):
+            continue
+        graph = {key: wrap(task) for (key, task) in dict(array.__dask_graph__()).items()}
+        datasets[name].data = dask.array.Array(graph, array.name, array.chunks,
+                                               dtype=array.dtype)
+    return datasets
+
+def _read_with_options(gdal_options, function, *args, **kwargs):
+    from datacube.utils.rio import activate_from_config
+    import rasterio
+    # Apply the default configuration first, so the read does not replace these options
+    activate_from_config()
+    with rasterio.Env(**gdal_options):
+        return function(*args, **kwargs)
+
+def generate_documents(asset, images, product, measurements=None):
     ''' Generates Datacube dataset documents from GEE image data.
 
     Args:
         asset (str): The asset ID of the product in the GEE catalog.
         images (list): A list of image data from the GEE API.
         product (datacube.model.DatasetType): A product to associate datasets with.
+        measurements (list): Optional; the measurements to include in the documents.
     Returns: A generated list of datacube.model.Dataset objects.
     '''
     from datacube.index.hl import prep_eo3
     from odc_gee.indexing import make_metadata_doc
     for image in images:
-        yield prep_eo3(make_metadata_doc(asset, image, product))
+        yield prep_eo3(make_metadata_doc(asset, image, product, measurements=measurements))
+
+def build_filter(search, properties=None, values=None):
+    ''' Builds a GEE listImages filter expression from ODC search terms.
+
+    Args:
+        search (dict): The search terms of a datacube.api.query.Query.
+        properties (dict): Optional; the ODC fields to filter and the GEE image properties they
+            map to. Defaults to FILTER_PROPERTIES. A field mapped to several properties matches
+            images where any of them match, so one mapping serves several collections.
+        values (dict): Optional; the ODC fields whose values are mapped to GEE property values,
+            as FILTER_VALUES (the default). Values are matched case insensitively, with - and _
+            alike. A field is only filtered if all of its values are mapped.
+
+    Returns: The filter expression, or None if no search term can be filtered.
+    '''
+    from datacube.model import Range
+    properties = FILTER_PROPERTIES if properties is None else properties
+    values = FILTER_VALUES if values is None else values
+    expressions = []
+    for field, names in properties.items():
+        value = search.get(field)
+        if value is None:
+            continue
+        if isinstance(value, Range):
+            conditions = [(op, bound) for (op, bound) in (('>=', value.begin), ('<=', value.end))
+                          if bound is not None]
+            join = ' AND '
+        elif isinstance(value, (list, tuple, set)):
+            conditions = [('=', _value) for _value in value]
+            join = ' OR '
+        else:
+            conditions = [('=', value)]
+            join = ' AND '
+        if conditions:
+            expressions.append(' OR '.join(
+                '(' + join.join(f'properties.{name} {op} {json.dumps(_value)}'
+                                for (op, _value) in conditions) + ')'
+                for name in names))
+    for field, mapping in values.items():
+        value = search.get(field)
+        if value is None or field in properties or isinstance(value, Range):
+            continue
+        value = value if isinstance(value, (list, tuple, set)) else [value]
+        conditions = [mapping.get(str(_value).lower().replace('-', '_')) for _value in value]
+        if conditions and None not in conditions:
+            expressions.append(' OR '.join(f'(properties.{name} = {json.dumps(_value)})'
+                                           for (name, _value) in conditions))
+    if not expressions:
+        return None
+    return ' AND '.join(f'({expression})' for expression in expressions)
+
+@lru_cache(maxsize=None)
+def band_type_table():
+    ''' Builds the lookup table of numpy type information used by get_type, once.
+
+    Returns: A tuple of dictionaries of the type information by (min, max) and by dtype.
+    '''
+    types = [numpy.iinfo(numpy.dtype(f'int{2**i}')) for i in range(3, 7)]\
+             + [numpy.iinfo(numpy.dtype(f'uint{2**i}')) for i in range(3, 7)]\
+             + [numpy.finfo(numpy.dtype(f'float{2**i}')) for i in range(4, 8)]
+    by_range, by_dtype = {}, {}
+    for _type in types:
+        by_range.setdefault((float(_type.min), float(_type.max)), _type)
+        by_dtype.setdefault(_type.dtype, _type)
+    return by_range, by_dtype
 
 def get_type(band_type):
     ''' Gets the band unit type from GEE metadata.
@@ -289,13 +1105,30 @@ def get_type(band_type):
 
     Returns: The data type of the band.
     '''
-    types = [numpy.iinfo(numpy.dtype(f'int{2**i}')) for i in range(3, 7)]\
-             + [numpy.iinfo(numpy.dtype(f'uint{2**i}')) for i in range(3, 7)]\
-             + [numpy.finfo(numpy.dtype(f'float{2**i}')) for i in range(4, 8)]
+    by_range, by_dtype = band_type_table()
     if band_type.get('min') is not None and band_type.get('max') is not None:
-        return list(filter(lambda x: True if x.min == band_type['min']
-                           and x.max == band_type['max'] else None, types))[0]
-    return list(filter(lambda x: numpy.dtype(band_type['precision']) == x.dtype, types))[0]
+        _type = by_range.get((float(band_type['min']), float(band_type['max'])))
+    else:
+        _type = by_dtype.get(numpy.dtype(band_type['precision']))
+    if _type is None:
+        raise ValueError(f'No data type matches the band type: {band_type}')
+    return _type
+
+def get_band_type(band):
+    ''' Converts the data type of a band in GEE REST API image metadata to a bandType.
+
+    Args:
+        band (dict): A band of the image metadata returned by listImages or assets.get.
+
+    Returns: A dictionary in the form of a GEE bandType metadata object, for get_type.
+    '''
+    data_type = band.get('dataType', {})
+    band_type = dict(type='PixelType', precision=data_type.get('precision', 'float').lower())
+    if 'range' in data_type:
+        # Zero values are left out of the API response
+        band_type.update(min=data_type['range'].get('min', 0),
+                         max=data_type['range'].get('max', 0))
+    return band_type
 
 def to_snake(string):
     ''' Cleans and formats strings from GEE metadata into snake case.
@@ -309,23 +1142,18 @@ def to_snake(string):
     return sub(r'[, -]+', '_',
                split(r'( \()|[.]', string)[0].replace('/', 'or').replace('&', 'and').lower())
 
-def get_datasets(asset=None, images=None, product=None):
+def get_datasets(asset=None, images=None, product=None, measurements=None):
     ''' Gets datasets for a Datacube load.
 
     Args:
         asset (str): The asset ID of the GEE asset.
         images (list): A list of image data from the GEE API.
         product (datacube.model.DatasetType): The product to associate dataset with.
+        measurements (list): Optional; the measurements being loaded. Only these bands are
+            parsed and put into the dataset documents.
 
     Returns: A generated list of datacube.model.Dataset objects.
     '''
-    for document in generate_documents(asset, images, product):
+    for document in generate_documents(asset, images, product, measurements):
         yield datacube.model.Dataset(product, document,
                                      uris=f'EEDAI://{asset}')
-
-def cleanup(key, request):
-    ''' Method to cleanup any leftover sensitive data. '''
-    if os.environ.get(key):
-        os.environ.pop(key)
-    if request:
-        request.session.close()
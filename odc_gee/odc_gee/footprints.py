@@ -0,0 +1,321 @@
+# pylint: disable=import-error,too-many-arguments,too-many-locals
+""" A local index of GEE image footprints.
+
+Images listed through the REST API are kept on disk with their footprints, along with
+the time ranges and regions that have been listed, in one SQLite database per collection
+and filter. Listings only append their new images, and touching time ranges listed for
+the same region are merged. Indexes are searched in memory, sorted by time. Later queries
+that fall inside listed ranges and regions are answered locally, and only the time ranges
+not yet listed are requested from the API. Datacube.load and Datacube.sample_points use it
+to select candidate images when a Datacube is created with footprints enabled.
+"""
+from contextlib import closing
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import numpy
+
+HOME = os.getenv('HOME')
+FOOTPRINTS_DIR = os.getenv('ODC_GEE_FOOTPRINTS', f'{HOME}/.cache/odc-gee/footprints')
+# The listImages parameters a footprint index can answer; others always go to the API
+INDEXED_PARAMETERS = {'parent', 'region', 'startTime', 'endTime', 'filter', 'fields'}
+SCHEMA = ('CREATE TABLE IF NOT EXISTS images (name TEXT PRIMARY KEY, time INTEGER, '
+          'xmin REAL, ymin REAL, xmax REAL, ymax REAL, image TEXT)',
+          'CREATE TABLE IF NOT EXISTS coverage (xmin REAL, ymin REAL, xmax REAL, ymax REAL, '
+          'start_time INTEGER, end_time INTEGER)')
+WORLD = (-180.0, -90.0, 180.0, 90.0)
+# Unbounded time ranges, in milliseconds since the epoch
+MIN_TIME = numpy.iinfo(numpy.int64).min
+MAX_TIME = numpy.iinfo(numpy.int64).max
+
+def to_millis(time):
+    ''' Converts a REST API timestamp to milliseconds since the epoch.
+
+    Args:
+        time (str): The timestamp (ex: 2020-01-01T00:00:00Z).
+
+    Returns: An integer of milliseconds.
+    '''
+    return int(numpy.datetime64(time.rstrip('Z'), 'ms').astype(numpy.int64))
+
+def from_millis(millis):
+    ''' Converts milliseconds since the epoch to a REST API timestamp.
+
+    Args:
+        millis (int): The milliseconds.
+
+    Returns: The timestamp string.
+    '''
+    return f'{numpy.datetime64(int(millis), "ms").item().strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]}Z'
+
+def region_bounds(region):
+    ''' Gets the bounding box of a listImages region.
+
+    Args:
+        region (str): The GeoJSON region, or None for the whole world.
+
+    Returns: A (xmin, ymin, xmax, ymax) tuple.
+    '''
+    if not region:
+        return WORLD
+    from shapely.geometry import shape
+    return tuple(shape(json.loads(region)).bounds)
+
+def bounds_region(bounds):
+    ''' Makes a listImages region of a bounding box.
+
+    Args:
+        bounds (tuple): The (xmin, ymin, xmax, ymax) bounding box.
+
+    Returns: The GeoJSON region, with straight edges in longitude and latitude.
+    '''
+    xmin, ymin, xmax, ymax = bounds
+    return json.dumps(dict(type='Polygon', coordinates=[[[xmin, ymin], [xmax, ymin], [xmax, ymax],
+                                                         [xmin, ymax], [xmin, ymin]]],
+                           geodesic=False))
+
+def subtract(interval, intervals):
+    ''' Gets the parts of a time interval not covered by other intervals.
+
+    Args:
+        interval (tuple): The (start, end) interval.
+        intervals (list): The covering (start, end) intervals.
+
+    Returns: A list of the uncovered (start, end) intervals.
+    '''
+    start, end = interval
+    gaps = []
+    for (_start, _end) in sorted(intervals):
+        if _end <= start:
+            continue
+        if _start >= end:
+            break
+        if _start > start:
+            gaps.append((start, _start))
+        start = max(start, _end)
+        if start >= end:
+            return gaps
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+class FootprintIndex:
+    ''' The listed images of one collection and filter, with a time and bounding box index.
+
+    Attributes:
+        path (str): The directory the index database is persisted in.
+        latency (datetime.timedelta): How long after their start time images may still be
+            added to the collection. Listed ranges more recent than this are not recorded as
+            covered, so they are listed again.
+    '''
+    def __init__(self, path, latency=timedelta(days=30)):
+        self.path = path
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._images = None
+        self._names = None
+        self._times = None
+        self._bounds = None
+        self._coverage = None
+
+    def _connect(self):
+        os.makedirs(self.path, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(self.path, 'index.db'), timeout=60)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        return connection
+
+    def _load(self):
+        if self._images is not None:
+            return
+        with closing(self._connect()) as connection:
+            rows = connection.execute('SELECT image, time, xmin, ymin, xmax, ymax FROM images '
+                                      'ORDER BY time, rowid').fetchall()
+            self._coverage = [((xmin, ymin, xmax, ymax), start, end)
+                              for (xmin, ymin, xmax, ymax, start, end)
+                              in connection.execute('SELECT * FROM coverage')]
+        self._images = [json.loads(row[0]) for row in rows]
+        self._times = numpy.array([row[1] for row in rows], dtype=numpy.int64)
+        self._bounds = numpy.array([row[2:] for row in rows], dtype=numpy.float64).reshape(-1, 4)
+        self._names = {image['name'] for image in self._images}
+
+    def clear(self):
+        ''' Removes every listed image and covered range, so queries are listed again. '''
+        with self._lock:
+            if os.path.exists(os.path.join(self.path, 'index.db')):
+                os.remove(os.path.join(self.path, 'index.db'))
+            self._images = None
+
+    def gaps(self, bounds, start=MIN_TIME, end=MAX_TIME):
+        ''' Gets the time ranges of a query that have not been listed.
+
+        Args:
+            bounds (tuple): The (xmin, ymin, xmax, ymax) bounding box of the query region.
+            start (int): The start of the query in milliseconds since the epoch.
+            end (int): The end of the query in milliseconds since the epoch.
+
+        Returns: A list of (start, end) ranges in milliseconds.
+        '''
+        with self._lock:
+            self._load()
+            covered = [(_start, _end) for (_bounds, _start, _end) in self._coverage
+                       if _bounds[0] <= bounds[0] and _bounds[1] <= bounds[1]
+                       and _bounds[2] >= bounds[2] and _bounds[3] >= bounds[3]]
+        return subtract((start, end), covered)
+
+    def add(self, images, bounds, start=MIN_TIME, end=MAX_TIME):
+        ''' Adds the images listed for a region and time range, and records them as covered.
+
+        Only the images not indexed yet are written. The range is merged with the covered
+        ranges of the same region that it overlaps or touches.
+
+        Args:
+            images (list): The listed images, with name, startTime and geometry fields.
+            bounds (tuple): The bounding box of the listed region.
+            start (int): The start of the listed range in milliseconds since the epoch.
+            end (int): The end of the listed range in milliseconds since the epoch.
+        '''
+        from shapely.geometry import shape
+        settled = to_millis((datetime.utcnow() - self.latency).isoformat())
+        bounds = tuple(float(bound) for bound in bounds)
+        with self._lock:
+            self._load()
+            images = list({image['name']: image for image in images
+                           if image['name'] not in self._names}.values())
+            times = numpy.array([to_millis(image['startTime']) if image.get('startTime')
+                                 else MIN_TIME for image in images], dtype=numpy.int64)
+            footprints = numpy.array([shape(image['geometry']).bounds if image.get('geometry')
+                                      else WORLD for image in images],
+                                     dtype=numpy.float64).reshape(-1, 4)
+            covered, merged = None, []
+            if min(end, settled) > start:
+                start, end = int(start), int(min(end, settled))
+                merged = [(_bounds, _start, _end) for (_bounds, _start, _end) in self._coverage
+                          if _bounds == bounds and _start <= end and _end >= start]
+                start = min([start] + [_start for (_, _start, _) in merged])
+                end = max([end] + [_end for (_, _, _end) in merged])
+                covered = (bounds, start, end)
+            with closing(self._connect()) as connection, connection:
+                connection.executemany('INSERT OR IGNORE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                       [(image['name'], int(time), *footprint, json.dumps(image))
+                                        for (image, time, footprint)
+                                        in zip(images, times, footprints.tolist())])
+                connection.executemany('DELETE FROM coverage WHERE xmin = ? AND ymin = ? AND '
+                                       'xmax = ? AND ymax = ? AND start_time = ? AND end_time = ?',
+                                       [(*_bounds, _start, _end)
+                                        for (_bounds, _start, _end) in merged])
+                if covered:
+                    connection.execute('INSERT INTO coverage VALUES (?, ?, ?, ?, ?, ?)',
+                                       (*bounds, start, end))
+            if images:
+                times = numpy.concatenate([self._times, times])
+                order = numpy.argsort(times, kind='stable')
+                all_images = self._images + images
+                self._images = [all_images[i] for i in order]
+                self._times = times[order]
+                self._bounds = numpy.concatenate([self._bounds, footprints])[order]
+                self._names.update(image['name'] for image in images)
+            if covered:
+                self._coverage = [coverage for coverage in self._coverage
+                                  if coverage not in merged] + [covered]
+
+    def search(self, bounds, start=MIN_TIME, end=MAX_TIME, region=None):
+        ''' Searches the indexed images.
+
+        Args:
+            bounds (tuple): The (xmin, ymin, xmax, ymax) bounding box to search.
+            start (int): The start of the search in milliseconds since the epoch (inclusive).
+            end (int): The end of the search in milliseconds since the epoch (exclusive).
+            region (str): Optional; a GeoJSON region that image footprints must intersect.
+
+        Returns: A list of the images found, in time order.
+        '''
+        with self._lock:
+            self._load()
+            first, last = numpy.searchsorted(self._times, [start, end], side='left')
+            footprints = self._bounds[first:last]
+            matches = numpy.flatnonzero((footprints[:, 2] >= bounds[0])
+                                        & (footprints[:, 0] <= bounds[2])
+                                        & (footprints[:, 3] >= bounds[1])
+                                        & (footprints[:, 1] <= bounds[3])) + first
+            images = [self._images[i] for i in matches]
+        if region and images:
+            from shapely.geometry import shape
+            region = shape(json.loads(region))
+            images = [image for image in images
+                      if not image.get('geometry') or shape(image['geometry']).intersects(region)]
+        return images
+
+class FootprintCache:
+    ''' Footprint indexes of the collections queried, persisted under one directory.
+
+    Attributes:
+        path (str): The base directory of the indexes.
+        latency (datetime.timedelta): The latency of the indexes, see FootprintIndex.
+    '''
+    def __init__(self, path=FOOTPRINTS_DIR, latency=timedelta(days=30)):
+        self.path = path
+        self.latency = latency
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, parameters):
+        ''' Gets the footprint index answering a listImages query.
+
+        Args:
+            parameters (dict): The listImages parameters.
+
+        Returns: A FootprintIndex, or None if the query cannot be answered from an index.
+        '''
+        if not set(parameters).issubset(INDEXED_PARAMETERS):
+            return None
+        key = hashlib.sha1(json.dumps([parameters['parent'], parameters.get('filter'),
+                                       parameters.get('fields')]).encode()).hexdigest()
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = FootprintIndex(os.path.join(self.path, key),
+                                                    latency=self.latency)
+            return self._indexes[key]
+
+    def clear(self):
+        ''' Removes every index, so all queries are listed through the API again. '''
+        with self._lock:
+            for index in self._indexes.values():
+                index.clear()
+            self._indexes = {}
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def list_images(self, parameters, list_images):
+        ''' Lists images, requesting only the time ranges not yet indexed from the API.
+
+        Args:
+            parameters (dict): The listImages parameters.
+            list_images (callable): Lists images from the API given parameters, as
+                Datacube.get_images.
+
+        Returns: A list of the images.
+        '''
+        # Gaps are listed over the bounding box of the region, the area recorded as covered,
+        # and the images found are then narrowed down to the region itself
+        index = self.get(parameters)
+        if index is None:
+            return list(list_images(parameters))
+        bounds = region_bounds(parameters.get('region'))
+        start = to_millis(parameters['startTime']) if 'startTime' in parameters else MIN_TIME
+        end = to_millis(parameters['endTime']) if 'endTime' in parameters else MAX_TIME
+        for (_start, _end) in index.gaps(bounds, start, end):
+            gap = {key: value for (key, value) in parameters.items()
+                   if key not in ('startTime', 'endTime')}
+            if 'region' in gap:
+                gap.update(region=bounds_region(bounds))
+            if _start != MIN_TIME:
+                gap.update(startTime=from_millis(_start))
+            if _end != MAX_TIME:
+                gap.update(endTime=from_millis(_end))
+            index.add(list(list_images(gap)), bounds, _start, _end)
+        return index.search(bounds, start, end, region=parameters.get('region'))
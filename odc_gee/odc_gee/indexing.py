@@ -1,4 +1,4 @@
-# pylint: disable=no-member,broad-except,import-error,unused-argument
+# pylint: disable=no-member,broad-except,import-error,unused-argument,protected-access
 ''' Indexes Google Earth Engine collections into Open Data Cube.
 
 This module provides the necessary functions to index data into an ODC database.
@@ -9,13 +9,14 @@ from collections import namedtuple
 from contextlib import redirect_stderr
 from datetime import datetime
 from re import sub
+import hashlib
 import io
+import json
+import threading
 import warnings
 
 import numpy
 
-from odc_gee import earthengine
-
 IndexParams = namedtuple('IndexParams', 'asset product filters')
 
 def add_dataset(doc, uri, index, sources_policy=None, update=None, **kwargs):
@@ -26,18 +27,24 @@ def add_dataset(doc, uri, index, sources_policy=None, update=None, **kwargs):
         uri: Some URI to point to the document (this doesn't have to actually point anywhere).
         index: An instance of a datacube index.
         sources_policy (optional): The source policy to be checked.
-        update: Update datasets if they already exist.
+        update: Update datasets if they already exist and their source image has changed, as
+            recorded by the gee:version property.
     Returns: The dataset to be indexed and any errors encountered.
     '''
     from datacube.index.hl import Doc2Dataset
     from datacube.utils import changes
 
+    existing = index.datasets.get(doc['id']) if update else None
+    if existing is not None and doc['properties'].get('gee:version') is not None\
+       and existing.metadata_doc['properties'].get('gee:version')\
+           == doc['properties']['gee:version']:
+        return existing
     resolver = Doc2Dataset(index, **kwargs)
     dataset, err = resolver(doc, uri)
     buff = io.StringIO()
     if err is None:
         with redirect_stderr(buff):
-            if update and index.datasets.get(dataset.id):
+            if existing is not None:
                 index.datasets.update(dataset, {tuple(): changes.allow_any})
             else:
                 index.datasets.add(dataset, sources_policy=sources_policy)
@@ -51,17 +58,75 @@ def add_dataset(doc, uri, index, sources_policy=None, update=None, **kwargs):
         raise ValueError(err)
     return dataset
 
-def make_metadata_doc(*args, **kwargs):
+def add_products(index, products):
+    ''' Adds product definitions to the index database in one transaction.
+
+    Products that are already indexed are checked to be unchanged, as with
+    index.products.add. Indexes not backed by the postgres driver add products one at a time.
+
+    Args:
+        index: An instance of a datacube index.
+        products (list): The datacube.model.DatasetType products to add.
+    Returns: A list of the indexed products.
+    '''
+    from datacube.model import DatasetType
+    from datacube.utils import jsonify_document
+    from datacube.utils.changes import check_doc_unchanged
+
+    if not hasattr(getattr(index, '_db', None), 'begin'):
+        return [index.products.add(product, allow_table_lock=True) for product in products]
+    new_products = []
+    metadata_types = {}
+    for product in products:
+        DatasetType.validate(product.definition)
+        existing = index.products.get_by_name(product.name)
+        if existing:
+            check_doc_unchanged(existing.definition, jsonify_document(product.definition),
+                                f'Product {product.name}')
+            continue
+        new_products.append(product)
+        name = product.metadata_type.name
+        if name not in metadata_types:
+            metadata_types[name] = index.metadata_types.get_by_name(name)\
+                                   or index.metadata_types.add(product.metadata_type,
+                                                               allow_table_lock=True)
+    with index._db.begin() as transaction:
+        for product in new_products:
+            metadata_type = metadata_types[product.metadata_type.name]
+            transaction.insert_product(name=product.name,
+                                       metadata=product.metadata_doc,
+                                       metadata_type_id=metadata_type.id,
+                                       search_fields=metadata_type.dataset_fields,
+                                       definition=product.definition,
+                                       concurrently=False)
+    return [index.products.get_by_name(product.name) for product in products]
+
+def image_version(image_data):
+    """ Gets a version of GEE image metadata that changes when the image is reprocessed.
+
+    Args:
+        image_data (dict): the image metadata from the GEE API.
+    Returns: the updateTime of the image, or a hash of its band and grid metadata if the
+        updateTime was not requested.
+    """
+    if image_data.get('updateTime'):
+        return image_data['updateTime']
+    bands = json.dumps([dict(id=band.get('id'), grid=band.get('grid'))
+                        for band in image_data.get('bands', [])], sort_keys=True)
+    return f'sha1:{hashlib.sha1(bands.encode()).hexdigest()}'
+
+def make_metadata_doc(asset, image_data, product, measurements=None):
     """ Makes the dataset document from the parsed metadata.
 
     Args:
         asset (str): the asset ID of the product in the GEE catalog.
         image_data (dict): the image metadata to parse.
         product (datacube.model.DatasetType): the product information from the ODC index.
+        measurements (list): Optional; the measurements to include in the document.
     Returns: a dictionary of the dataset document.
     """
     from odc_gee.parser import parse
-    metadata = parse(*args, **kwargs)
+    metadata = parse(asset, image_data, product, measurements=measurements)
     doc = {'id': metadata.id,
            '$schema': 'https://schemas.opendatacube.org/dataset',
            'product': {'name': metadata.product},
@@ -73,7 +138,8 @@ def make_metadata_doc(*args, **kwargs):
                           'dtr:start_datetime': metadata.from_dt,
                           'dtr:end_datetime': metadata.to_dt,
                           'datetime': metadata.center_dt,
-                          'gee:asset': metadata.asset},
+                          'gee:asset': metadata.asset,
+                          'gee:version': image_version(image_data)},
            'geometry': metadata.geometry.json,
            'grids': {idx if idx else 'default': dict(shape=metadata.shapes[idx],
                                                      transform=metadata.transforms[idx])\
@@ -87,6 +153,20 @@ def make_metadata_doc(*args, **kwargs):
            'lineage': {'source_datasets': {}}}
     return doc
 
+def tiles(latitude, longitude, tile_size):
+    """ Splits latitude and longitude extents into square tiles.
+
+    Args:
+        latitude (tuple): the minimum and maximum latitude.
+        longitude (tuple): the minimum and maximum longitude.
+        tile_size (float): the width and height of the tiles in degrees.
+    Returns: a generated list of (latitude, longitude) tuples of the tile extents.
+    """
+    for lat in numpy.arange(min(latitude), max(latitude), tile_size):
+        for lon in numpy.arange(min(longitude), max(longitude), tile_size):
+            yield ((float(lat), float(min(lat + tile_size, max(latitude)))),
+                   (float(lon), float(min(lon + tile_size, max(longitude)))))
+
 class Indexer:
     ''' Object for indexing GEE products into ODC.
 
@@ -94,9 +174,11 @@ class Indexer:
         datacube (odc_gee.earthengine.Datacube): An ODC wrapper for GEE specific uses.
     '''
     def __init__(self, app='GEE_Indexer', **kwargs):
+        from odc_gee import earthengine
         self.datacube = earthengine.Datacube(app=app, **kwargs)
+        self._seen_lock = threading.Lock()
 
-    def __call__(self, *args, update=False, response=None, image_sum=0):
+    def __call__(self, *args, update=False, response=None, image_sum=0, seen=None):
         """ Performs the parsing and indexing.
 
         Args:
@@ -107,6 +189,9 @@ class Indexer:
             update (bool): will update existing datasets if set True.
             response: a Requests response from a previous API result.
             image_sum (int): the current sum of images indexed.
+            seen (set): Optional; the names of images already indexed by other calls (ex: for
+                neighbouring tiles, which list the images crossing their borders too). These
+                images are skipped and not counted, and the images indexed are added to it.
         Returns:
             A tuple of the Requests response from the API query
             and the recursive sum of datasets found.
@@ -121,6 +206,11 @@ class Indexer:
         product_bands = list(product.measurements.keys())
 
         for image in self.datacube.get_images(index_params.filters):
+            if seen is not None:
+                with self._seen_lock:
+                    if image['name'] in seen:
+                        continue
+                    seen.add(image['name'])
             bands = [band['id'] for band in image['bands']]
             band_length = len(list(filter(lambda x: x in product_bands, bands)))
             if band_length == len(product.measurements):
@@ -154,7 +244,7 @@ class Indexer:
 
         Returns: A tuple of datetime.datetime objects.
         '''
-        asset_info = self.datacube.ee.data.getAsset(kwargs['asset'])
+        asset_info = self.datacube.get_asset(kwargs['asset'])
         if kwargs.get('time'):
             time = (sub(r'[\(\)\[\] ]', '', kwargs['time']).split(','))\
                    if isinstance(kwargs['time'], str) else kwargs.get('time')
@@ -24,28 +24,34 @@ Metadata = namedtuple('Metadata', ','.join(['id',
                                             'path',
                                             'bands']))
 
-def parse(asset, image_data, product):
+def parse(asset, image_data, product, measurements=None):
     """ Parses the GEE metadata for ODC use.
 
     Args:
         asset (str): the asset ID of the product in the GEE catalog.
         image_data (dict): the image metadata to parse.
         product (datacube.model.DatasetType): the product information from the ODC index.
+        measurements (list): Optional; the names or aliases of the measurements to parse.
+            Only these bands and their grids are parsed. Defaults to all measurements.
 
     Returns: a namedtuple of the data required by ODC for indexing.
     """
     bands = tuple(zip(product.measurements, image_data['bands']))
+    if measurements is not None:
+        measurements = [measurements] if isinstance(measurements, str) else measurements
+        names = [measurement.name for measurement
+                 in product.lookup_measurements(measurements).values()]
+        bands = tuple((name, band) for (name, band) in bands if name in names)
     _id = str(uuid.uuid5(uuid.NAMESPACE_URL, f'EEDAI:{product.name}/{image_data["name"]}'))
     creation_dt = image_data['startTime']
-    spatial_reference = image_data['bands'][0]['grid']\
-                        .get('crsCode', image_data['bands'][0]['grid'].get('crsWkt'))
+    spatial_reference = bands[0][1]['grid'].get('crsCode', bands[0][1]['grid'].get('crsWkt'))
     # Handle special GEE Infinity GeoJSON responses
     image_data['geometry']['coordinates'][0] = [[float(x), float(y)]
                                                 for (x, y) \
                                                 in image_data['geometry']['coordinates'][0]]
     geometry = Geometry(image_data['geometry'])
 
-    grids = [band['grid'] for band in image_data['bands']]
+    grids = [band['grid'] for (_, band) in bands]
     grids_copy = grids.copy()
     grids = list(filter(lambda grid:
                         grids_copy.pop(grids_copy.index(grid)) \
@@ -57,8 +63,6 @@ def parse(asset, image_data, product):
     transforms = [list(Affine(affine_value[0], 0, affine_value[1],
                               affine_value[2], 0, affine_value[3]))\
                   for affine_value in affine_values]
-    bands = tuple(zip(product.measurements,
-                      image_data['bands']))
 
     metadata = Metadata(id=_id,
                         product=product.name,
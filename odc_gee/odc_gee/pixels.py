@@ -0,0 +1,201 @@
+# pylint: disable=import-error,too-many-arguments,too-many-locals
+""" Native pixel reads from the Google Earth Engine REST API.
+
+An alternative to reading through GDAL's EEDAI driver: blocks aligned to the output grid
+are requested from the getPixels endpoint as NPY in parallel, decoded as views of the
+response bytes, and copied once into the destination arrays where each image is valid.
+Select it with Datacube.load(..., driver='pixels').
+"""
+from concurrent.futures import ThreadPoolExecutor
+import io
+
+from affine import Affine
+import numpy
+
+from odc_gee.client import API_URL, Client
+
+def decode_npy(content):
+    ''' Decodes an NPY response without copying its data.
+
+    Args:
+        content (bytes): The NPY file content.
+
+    Returns: A read-only numpy array viewing the content.
+    '''
+    stream = io.BytesIO(content)
+    version = numpy.lib.format.read_magic(stream)
+    if version == (1, 0):
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(stream)
+    else:
+        shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(stream)
+    count = int(numpy.prod(shape))
+    array = numpy.frombuffer(content, dtype=dtype, count=count, offset=stream.tell())
+    return array.reshape(shape, order='F' if fortran_order else 'C')
+
+def split_path(path):
+    ''' Splits an EEDAI measurement path into the image name and band ID.
+
+    Args:
+        path (str): The path (ex: EEDAI:projects/earthengine-public/assets/ID:B3).
+
+    Returns: A tuple of the image name and band ID.
+    '''
+    name, band = path[len('EEDAI:'):].lstrip('/').rsplit(':', 1)
+    return name, band
+
+class PixelReader:
+    ''' Reads pixels of GEE images through the getPixels endpoint.
+
+    Attributes:
+        session (odc_gee.earthengine.Session): The session authorizing requests and holding
+            the pooled HTTP connections.
+        api_url (str): The base URL of the REST API.
+        block_size (int): The width and height of the blocks requested.
+        workers (int): The number of requests in flight at once. The session's
+            max_connections limits the connections they share.
+        retries (int): The number of times a throttled or failed request is retried.
+        timeout (float): The timeout of a request in seconds.
+    '''
+    def __init__(self, session, api_url=API_URL, block_size=512, workers=8, retries=3,
+                 timeout=120):
+        self.session = session
+        self.api_url = api_url.rstrip('/')
+        self.block_size = block_size
+        self.workers = workers
+        self.retries = retries
+        self.timeout = timeout
+        self._client = Client(session, api_url=api_url, timeout=timeout, retries=retries)
+
+    def fetch(self, name, bands, transform, crs, shape):
+        ''' Fetches one block of pixels.
+
+        Args:
+            name (str): The image asset name.
+            bands (list): The band IDs to fetch.
+            transform (affine.Affine): The transform of the block.
+            crs (str): The CRS of the block.
+            shape (tuple): The height and width of the block.
+
+        Returns: A structured numpy array with a field per band, viewing the response.
+        '''
+        crs = str(crs)
+        grid = dict(dimensions=dict(width=shape[1], height=shape[0]),
+                    affineTransform=dict(scaleX=transform.a, shearX=transform.b,
+                                         translateX=transform.c, shearY=transform.d,
+                                         scaleY=transform.e, translateY=transform.f))
+        if crs.upper().startswith('EPSG:'):
+            grid.update(crsCode=crs)
+        else:
+            grid.update(crsWkt=crs)
+        body = dict(fileFormat='NPY', bandIds=list(bands), grid=grid)
+        response = self._client.request('POST', f'{self.api_url}/{name}:getPixels', json=body)
+        return decode_npy(response.content)
+
+    def blocks(self, shape):
+        ''' Splits a grid into blocks.
+
+        Args:
+            shape (tuple): The height and width of the grid.
+
+        Returns: A generated list of (row slice, column slice) tuples.
+        '''
+        for row in range(0, shape[0], self.block_size):
+            for col in range(0, shape[1], self.block_size):
+                yield (slice(row, min(row + self.block_size, shape[0])),
+                       slice(col, min(col + self.block_size, shape[1])))
+
+    def sample(self, name, bands, grid, lons, lats):
+        ''' Reads the pixels of an image under points.
+
+        Points are grouped by the block of the image grid they fall in, and only the window
+        around the points of each block is requested.
+
+        Args:
+            name (str): The image asset name.
+            bands (list): The band IDs to read, which share the grid.
+            grid (dict): The pixel grid of the bands, as in listImages band metadata.
+            lons (numpy.ndarray): The longitudes of the points.
+            lats (numpy.ndarray): The latitudes of the points.
+
+        Returns: A structured numpy array with a field per band and a row per point.
+        '''
+        from rasterio.warp import transform as reproject
+        crs = grid.get('crsCode', grid.get('crsWkt'))
+        affine = grid.get('affineTransform', {})
+        transform = Affine(affine.get('scaleX', 0), affine.get('shearX', 0),
+                           affine.get('translateX', 0), affine.get('shearY', 0),
+                           affine.get('scaleY', 0), affine.get('translateY', 0))
+        xs, ys = reproject('EPSG:4326', crs, list(lons), list(lats))
+        cols, rows = ~transform * (numpy.asarray(xs), numpy.asarray(ys))
+        cols = numpy.floor(cols).astype(numpy.int64)
+        rows = numpy.floor(rows).astype(numpy.int64)
+        keys = numpy.stack([rows // self.block_size, cols // self.block_size], axis=1)
+        _, groups = numpy.unique(keys, axis=0, return_inverse=True)
+        values = None
+        for group in range(groups.max() + 1 if len(groups) else 0):
+            points = numpy.flatnonzero(groups.ravel() == group)
+            row, col = rows[points].min(), cols[points].min()
+            shape = (int(rows[points].max() - row + 1), int(cols[points].max() - col + 1))
+            block = self.fetch(name, bands, transform * Affine.translation(col, row), crs, shape)
+            if not block.dtype.names:
+                block = block.view([(bands[0], block.dtype)])
+            if values is None:
+                values = numpy.zeros(len(rows), dtype=block.dtype)
+            values[points] = block[rows[points] - row, cols[points] - col]
+        return values
+
+    def read(self, sources, transform, crs, outputs):
+        ''' Reads and fuses pixels of several images into destination arrays in parallel.
+
+        Images are fused in order, keeping the first valid pixel as GDAL does. getPixels sets
+        pixels outside an image to 0 rather than to a nodata value, so a pixel is valid where
+        it falls inside the image footprint. Blocks already filled by earlier images are not
+        requested again.
+
+        Args:
+            sources (list): Tuples of the destination index (ex: a time index) and a list of
+                images to fuse there. Each image is a dictionary of output names to EEDAI
+                paths, or a (paths, footprint) tuple with the image footprint as a GeoJSON
+                geometry in the output CRS. Images without a footprint are valid everywhere.
+            transform (affine.Affine): The transform of the output grid.
+            crs (str): The CRS of the output grid.
+            outputs (dict): The destination arrays and their nodata values by output name, as
+                (array, nodata) tuples. The last two dimensions of the arrays are the grid.
+        '''
+        from rasterio.features import geometry_mask
+        shape = next(iter(outputs.values()))[0].shape[-2:]
+
+        def read_block(index, images, rows, cols):
+            block_transform = transform * Affine.translation(cols.start, rows.start)
+            block_shape = (rows.stop - rows.start, cols.stop - cols.start)
+            filled = {output: numpy.zeros(block_shape, dtype=bool) for output in outputs}
+            for image in images:
+                paths, footprint = image if isinstance(image, tuple) else (image, None)
+                by_image = {}
+                for (output, path) in paths.items():
+                    if output in outputs and not filled[output].all():
+                        name, band = split_path(path)
+                        by_image.setdefault(name, []).append((output, band))
+                if not by_image:
+                    continue
+                valid = numpy.ones(block_shape, dtype=bool) if footprint is None else\
+                        geometry_mask([footprint], block_shape, block_transform, invert=True)
+                if not valid.any():
+                    continue
+                for (name, bands) in by_image.items():
+                    block = self.fetch(name, [band for (_, band) in bands],
+                                       block_transform, crs, block_shape)
+                    for (output, band) in bands:
+                        dest = outputs[output][0][index][rows, cols]
+                        fill = valid & ~filled[output]
+                        # The one copy from the response buffer, of the pixels being filled
+                        numpy.copyto(dest, block[band] if block.dtype.names else block,
+                                     casting='unsafe', where=fill)
+                        filled[output] |= fill
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(read_block, index, images, rows, cols)
+                       for (index, images) in sources if images
+                       for (rows, cols) in self.blocks(shape)]
+            for future in futures:
+                future.result()
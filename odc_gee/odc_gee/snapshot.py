@@ -0,0 +1,233 @@
+# pylint: disable=import-error,too-many-arguments,too-many-locals,protected-access
+""" GeoParquet snapshots of indexed GEE products.
+
+A snapshot holds the eo3 dataset documents of indexed products, as written by
+odc_gee.indexing.make_metadata_doc, with their footprints as WKB, partitioned by product
+and year (ex: snapshot/product=ls8_google/year=2020/part-0.parquet). The product
+definitions are kept next to their partitions, so a snapshot can be loaded into an empty
+index without listing images through the GEE API again. Snapshots are also plain
+GeoParquet, so the catalog can be queried offline with columnar scans (see read_snapshot).
+
+Reading and writing snapshots requires pyarrow, which is installed with the `snapshot`
+extra (pip install odc-gee[snapshot]).
+"""
+import csv
+import io
+import json
+import os
+
+GEO_METADATA = {'version': '0.4.0',
+                'primary_column': 'geometry',
+                'columns': {'geometry': {'encoding': 'WKB',
+                                         'geometry_type': 'Polygon',
+                                         'crs': 'EPSG:4326'}}}
+PRODUCT_FILE = '_product.json'
+
+def snapshot_schema():
+    ''' Gets the schema of snapshot files, with the GeoParquet metadata.
+
+    Returns: A pyarrow.Schema.
+    '''
+    import pyarrow as pa
+    return pa.schema([('id', pa.string()),
+                      ('time', pa.timestamp('ms', tz='UTC')),
+                      ('xmin', pa.float64()),
+                      ('ymin', pa.float64()),
+                      ('xmax', pa.float64()),
+                      ('ymax', pa.float64()),
+                      ('geometry', pa.binary()),
+                      ('uri', pa.string()),
+                      ('document', pa.string())],
+                     metadata={'geo': json.dumps(GEO_METADATA)})
+
+def dataset_row(dataset):
+    ''' Makes a snapshot row from an indexed dataset.
+
+    Args:
+        dataset (datacube.model.Dataset): The indexed dataset.
+
+    Returns: A dictionary of the row values.
+    '''
+    from shapely.geometry import shape
+    doc = dataset.metadata_doc
+    footprint = shape(doc['geometry'])
+    xmin, ymin, xmax, ymax = footprint.bounds
+    return dict(id=str(dataset.id),
+                time=dataset.center_time,
+                xmin=xmin, ymin=ymin, xmax=xmax, ymax=ymax,
+                geometry=footprint.wkb,
+                uri=dataset.uris[0] if dataset.uris else None,
+                document=json.dumps(doc))
+
+def export_snapshot(index, product, path, batch_size=10000, **query):
+    ''' Exports the datasets of an indexed product to a GeoParquet snapshot.
+
+    Args:
+        index (datacube.index.Index): The index to export from.
+        product (str): The product name.
+        path (str): The root directory of the snapshot.
+        batch_size (int): The number of rows buffered per year before they are written.
+        query: Optional; further search terms (ex: time, lat, lon).
+
+    Returns: The number of datasets exported.
+    '''
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = snapshot_schema()
+    product_dir = os.path.join(path, f'product={product}')
+    os.makedirs(product_dir, exist_ok=True)
+    with open(os.path.join(product_dir, PRODUCT_FILE), 'w') as _file:
+        json.dump(index.products.get_by_name(product).definition, _file, default=str)
+
+    writers = {}
+    batches = {}
+
+    def flush(year):
+        rows = batches.pop(year)
+        table = pa.Table.from_pydict({name: [row[name] for row in rows]
+                                      for name in schema.names}, schema=schema)
+        writers[year].write_table(table)
+
+    count = 0
+    try:
+        for dataset in index.datasets.search(product=product, **query):
+            row = dataset_row(dataset)
+            year = row['time'].year
+            if year not in writers:
+                year_dir = os.path.join(product_dir, f'year={year}')
+                os.makedirs(year_dir, exist_ok=True)
+                writers[year] = pq.ParquetWriter(os.path.join(year_dir, 'part-0.parquet'),
+                                                 schema, compression='snappy')
+            batches.setdefault(year, []).append(row)
+            if len(batches[year]) >= batch_size:
+                flush(year)
+            count += 1
+        for year in list(batches):
+            flush(year)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return count
+
+def read_snapshot(path, columns=None, product=None, time=None, bbox=None):
+    ''' Reads a snapshot, scanning only the partitions and columns needed.
+
+    Args:
+        path (str): The root directory of the snapshot.
+        columns (list): Optional; the columns to read. Defaults to every column.
+        product (str): Optional; a product name to filter by.
+        time (tuple): Optional; start and end datetimes to filter by.
+        bbox (tuple): Optional; a (xmin, ymin, xmax, ymax) longitude/latitude box that
+            footprint bounding boxes must intersect.
+
+    Returns: A pyarrow.Table of the matching rows, with product and year columns.
+    '''
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    expression = None
+
+    def _and(condition):
+        return condition if expression is None else expression & condition
+
+    if product is not None:
+        expression = _and(ds.field('product') == product)
+    if time is not None:
+        start, end = [_utc(value) for value in time]
+        expression = _and((ds.field('year') >= start.year) & (ds.field('year') <= end.year)
+                          & (ds.field('time') >= start) & (ds.field('time') <= end))
+    if bbox is not None:
+        xmin, ymin, xmax, ymax = bbox
+        expression = _and((ds.field('xmax') >= xmin) & (ds.field('xmin') <= xmax)
+                          & (ds.field('ymax') >= ymin) & (ds.field('ymin') <= ymax))
+    return dataset.to_table(columns=columns, filter=expression)
+
+def _utc(value):
+    import pandas
+    value = pandas.Timestamp(value)
+    return (value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC'))\
+           .to_pydatetime()
+
+def add_products(index, path, products=None):
+    ''' Adds the product definitions of a snapshot that are missing from an index.
+
+    Args:
+        index (datacube.index.Index): The index to add the products to.
+        path (str): The root directory of the snapshot.
+        products (list): Optional; the product names to add. Defaults to every product.
+
+    Returns: A list of the product names in the snapshot that were selected.
+    '''
+    names = []
+    for entry in sorted(os.listdir(path)):
+        if not entry.startswith('product='):
+            continue
+        name = entry[len('product='):]
+        if products and name not in products:
+            continue
+        names.append(name)
+        if index.products.get_by_name(name) is None:
+            with open(os.path.join(path, entry, PRODUCT_FILE), 'r') as _file:
+                index.products.add_document(json.load(_file))
+    return names
+
+def import_snapshot(index, path, products=None, batch_size=10000):
+    ''' Bulk loads a snapshot into an index.
+
+    Datasets are copied into a temporary table with COPY and moved into the dataset and
+    location tables in one transaction, skipping datasets that are already indexed.
+    Indexes that are not backed by the postgres driver fall back to adding datasets one
+    at a time.
+
+    Args:
+        index (datacube.index.Index): The index to load into.
+        path (str): The root directory of the snapshot.
+        products (list): Optional; the product names to load. Defaults to every product.
+        batch_size (int): The number of rows read and copied at a time.
+
+    Returns: The number of datasets read from the snapshot.
+    '''
+    import pyarrow.dataset as ds
+    names = add_products(index, path, products)
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    batches = dataset.to_batches(columns=['id', 'product', 'uri', 'document'],
+                                 filter=ds.field('product').isin(names),
+                                 batch_size=batch_size)
+    if not hasattr(getattr(index, '_db', None), 'begin'):
+        return _add_batches(index, batches)
+
+    count = 0
+    with index._db.begin() as transaction:
+        cursor = transaction._connection.connection.cursor()
+        cursor.execute('CREATE TEMPORARY TABLE odc_gee_snapshot '
+                       '(id uuid, product text, uri text, metadata jsonb) ON COMMIT DROP')
+        for batch in batches:
+            rows = batch.to_pydict()
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(zip(rows['id'], rows['product'],
+                                             rows['uri'], rows['document']))
+            buffer.seek(0)
+            cursor.copy_expert('COPY odc_gee_snapshot FROM STDIN WITH (FORMAT csv)', buffer)
+            count += batch.num_rows
+        cursor.execute('INSERT INTO agdc.dataset '
+                       '(id, metadata_type_ref, dataset_type_ref, metadata) '
+                       'SELECT snapshot.id, product.metadata_type_ref, product.id, '
+                       'snapshot.metadata FROM odc_gee_snapshot AS snapshot '
+                       'JOIN agdc.dataset_type AS product ON product.name = snapshot.product '
+                       'ON CONFLICT (id) DO NOTHING')
+        cursor.execute('INSERT INTO agdc.dataset_location (dataset_ref, uri_scheme, uri_body) '
+                       "SELECT id, split_part(uri, ':', 1), substr(uri, strpos(uri, ':') + 1) "
+                       "FROM odc_gee_snapshot WHERE strpos(uri, ':') > 0 "
+                       'ON CONFLICT (uri_scheme, uri_body, dataset_ref) DO NOTHING')
+        cursor.close()
+    return count
+
+def _add_batches(index, batches):
+    from odc_gee.indexing import add_dataset
+    count = 0
+    for batch in batches:
+        rows = batch.to_pydict()
+        for (product, uri, document) in zip(rows['product'], rows['uri'], rows['document']):
+            add_dataset(json.loads(document), uri, index, products=[product])
+        count += batch.num_rows
+    return count
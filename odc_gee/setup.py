@@ -15,7 +15,13 @@ setup(name='odc-gee',
           "earthengine-api>=0.1.24",
           "numpy>=1.18.4",
           "rasterio>=1.1.8",
+          "requests>=2.24.0",
           "google-api-core==1.31.2"
           ],
+      extras_require={
+          "async": ["aiohttp>=3.6.2"],
+          "snapshot": ["pyarrow>=2.0.0", "shapely>=1.6.4"],
+          },
       packages=find_packages(),
-      scripts=['scripts/index_gee', 'scripts/new_product'],)
+      scripts=['scripts/index_gee', 'scripts/new_product',
+               'scripts/export_gee', 'scripts/import_gee'],)
@@ -0,0 +1,20 @@
+''' Test doubles shared by the odc_gee tests. '''
+import requests
+
+class TokenSession:
+    ''' A session handing out fixed tokens, standing in for earthengine.Session.
+
+    The first token is handed out until it is rejected, then the next one (the last token is
+    never rejected).
+    '''
+    http = requests.Session()
+
+    def __init__(self, *tokens):
+        self.tokens = list(tokens) or ['valid']
+        self.cached_token = self.tokens[0]
+
+    def access_token(self, stale=None):
+        if stale in self.tokens and len(self.tokens) > 1:
+            self.tokens.remove(stale)
+        self.cached_token = self.tokens[0]
+        return self.cached_token
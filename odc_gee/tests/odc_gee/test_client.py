@@ -0,0 +1,139 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+import asyncio
+import json
+import unittest
+
+from aiohttp import web
+
+from odc_gee.client import AsyncClient, Client, FailoverClient, ThreadedClient, asset_id,\
+                           asset_name
+from tests.odc_gee.helpers import TokenSession
+
+ASSET = 'LANDSAT/LC08/C01/T1_SR'
+
+async def list_images(request):
+    if request.headers.get('Authorization') != 'Bearer valid':
+        return web.json_response(dict(error='UNAUTHENTICATED'), status=401)
+    if request.query.get('pageToken') == '2':
+        return web.json_response(dict(images=[dict(id='image_2')]))
+    return web.json_response(dict(images=[dict(id='image_1')], nextPageToken='2'))
+
+async def list_assets(request):
+    if request.query.get('pageToken') == '2':
+        return web.json_response(dict(assets=[dict(name=asset_name('LANDSAT/LC08/C01/T2'))]))
+    return web.json_response(dict(assets=[dict(id='LANDSAT/LC08/C01/T1',
+                                               name=asset_name('LANDSAT/LC08/C01/T1'))],
+                                  nextPageToken='2'))
+
+class AsyncClientTestCase(unittest.TestCase):
+    def run_with_server(self, coroutine):
+        async def run():
+            app = web.Application()
+            app.router.add_get(f'/{asset_name(ASSET)}:listImages', list_images)
+            app.router.add_get(f'/{asset_name("LANDSAT/LC08/C01")}:listAssets', list_assets)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, 'localhost', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                async with AsyncClient(TokenSession('expired', 'valid'), api_url=f'http://localhost:{port}') as client:
+                    return await coroutine(client)
+            finally:
+                await runner.cleanup()
+        return asyncio.new_event_loop().run_until_complete(run())
+
+    def test_list_images(self):
+        async def list_all(client):
+            return [image['id'] async for image
+                    in client.list_images(dict(parent=asset_name(ASSET)))]
+        self.assertEqual(self.run_with_server(list_all), ['image_1', 'image_2'],
+                         'Expected every page after refreshing the rejected token')
+
+    def test_list_assets(self):
+        async def list_all(client):
+            return [asset_id(asset['name']) async for asset
+                    in client.list_assets('LANDSAT/LC08/C01')]
+        self.assertEqual(self.run_with_server(list_all),
+                         ['LANDSAT/LC08/C01/T1', 'LANDSAT/LC08/C01/T2'])
+
+class AccountPool:
+    ''' A pool of sessions, standing in for earthengine.SessionPool. '''
+    def __init__(self, *tokens):
+        self.sessions = [TokenSession(token) for token in tokens]
+        self.throttled_sessions = []
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, key=None):
+        return next(session for session in self.sessions
+                    if session not in self.throttled_sessions)
+
+    def throttled(self, session):
+        self.throttled_sessions.append(session)
+
+class QuotaHandler(BaseHTTPRequestHandler):
+    ''' Throttles every request of the account whose token is "exhausted". '''
+    def do_GET(self):
+        status = 429 if self.headers['Authorization'] == 'Bearer exhausted' else 200
+        self.send_response(status)
+        self.end_headers()
+        self.wfile.write(json.dumps(dict(token=self.headers['Authorization'])).encode())
+
+    def log_message(self, *args):
+        pass
+
+class FailoverClientTestCase(unittest.TestCase):
+    def test_failover(self):
+        server = HTTPServer(('localhost', 0), QuotaHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            pool = AccountPool('exhausted', 'available')
+            client = FailoverClient(pool, 'shard', retries=0)
+            response = client.get_json(f'http://localhost:{server.server_port}/asset')
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(response, dict(token='Bearer available'),
+                         'Expected the request to fail over to the available account')
+        self.assertEqual(pool.throttled_sessions, [pool.sessions[0]])
+
+class ImagesHandler(BaseHTTPRequestHandler):
+    ''' Serves two pages of listImages results. '''
+    def do_GET(self):
+        page = 2 if 'pageToken=2' in self.path else 1
+        response = dict(images=[dict(id=f'image_{page}')])
+        if page == 1:
+            response.update(nextPageToken='2')
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(json.dumps(response).encode())
+
+    def log_message(self, *args):
+        pass
+
+class ThreadedClientTestCase(unittest.TestCase):
+    def test_list_images(self):
+        server = HTTPServer(('localhost', 0), ImagesHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        client = Client(TokenSession(), api_url=f'http://localhost:{server.server_port}')
+
+        async def list_images(parameters):
+            async with ThreadedClient(client, limit=2) as threaded:
+                return [image['id'] async for image in threaded.list_images(parameters)]
+
+        loop = asyncio.new_event_loop()
+        try:
+            images = loop.run_until_complete(list_images(dict(parent=ASSET)))
+            first = loop.run_until_complete(list_images(dict(parent=ASSET, pageSize=1)))
+        finally:
+            loop.close()
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(images, ['image_1', 'image_2'])
+        self.assertEqual(first, ['image_1'], 'Expected one page to be listed for a pageSize')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import os
 import unittest
 from pathlib import Path
 
+from datacube.model import Range
 from tests.odc_gee.test_indexing import IndexerTestCase
 from xarray import Dataset
 
@@ -19,11 +20,20 @@ class DatacubeTestCase(unittest.TestCase):
                               'Cannot init earthengine.Datacube')
         return datacube
 
-    def test_singleton(self):
+    def test_shared_instance(self):
         dc1 = self.test_init()
         dc2 = self.test_init()
         self.assertEqual(id(dc1), id(dc2),
-                         'There can only be one earthengine.Datacube instance')
+                         'Expected one earthengine.Datacube instance per configuration')
+
+    def test_separate_sessions(self):
+        session = earthengine.Session.get(CREDENTIALS)
+        self.assertIs(session, earthengine.Session.get(CREDENTIALS),
+                      'Expected one session per set of credentials')
+        self.assertIsNot(session, earthengine.Session.get(f'{CREDENTIALS}.other'),
+                         'Expected separate sessions for separate credentials')
+        with self.assertRaises(ValueError, msg='Expected differing session options to raise'):
+            earthengine.Session.get(CREDENTIALS, retries=session.retries + 1)
 
     def test_destruction(self):
         self.assertNotIn('EEDA_BEARER', os.environ,
@@ -59,5 +69,46 @@ class DatacubeTestCase(unittest.TestCase):
         self.assertIn('time', dataset,
                       'Expected time coordinate in Dataset')
 
+class BuildFilterTestCase(unittest.TestCase):
+    def test_build_filter(self):
+        search = dict(cloud_cover=Range(0, 20), platform='LANDSAT_8', verbosity=1)
+        expected = '((properties.CLOUD_COVER >= 0 AND properties.CLOUD_COVER <= 20))'\
+                   ' AND ((properties.SPACECRAFT_ID = "LANDSAT_8"))'
+        properties = dict(cloud_cover=['CLOUD_COVER'], platform=['SPACECRAFT_ID'])
+        self.assertEqual(earthengine.build_filter(search, properties), expected)
+        self.assertIsNone(earthengine.build_filter(dict(verbosity=1)),
+                          'Expected no filter for unmapped search terms')
+
+    def test_build_filter_values(self):
+        self.assertEqual(earthengine.build_filter(dict(platform='landsat_8')),
+                         '((properties.SPACECRAFT_ID = "LANDSAT_8"))')
+        self.assertEqual(earthengine.build_filter(dict(platform=['Sentinel-2A', 'sentinel_2b'])),
+                         '((properties.SPACECRAFT_NAME = "Sentinel-2A")'
+                         ' OR (properties.SPACECRAFT_NAME = "Sentinel-2B"))')
+        self.assertIsNone(earthengine.build_filter(dict(platform=['landsat_8', 'unknown'])),
+                          'Expected no filter for unmapped values')
+
+class WithGdalOptionsTestCase(unittest.TestCase):
+    def test_wraps_read_tasks(self):
+        from functools import partial
+        from datacube.api.core import fuse_lazy
+        import dask.array
+        import numpy
+        graph = {('read', 0, 0): (fuse_lazy, ['dataset-1'], None, None, False, 1),
+                 ('read', 0, 1): (numpy.full, (1, 2, 2), 0, 'int16'),
+                 'dataset-1': None}
+        array = dask.array.Array(graph, 'read', ((1,), (2,), (2, 2)), dtype='int16')
+        dataset = Dataset(dict(band=(('time', 'y', 'x'), array[:, :, 1:3] + 1)))
+        graph = dict(earthengine.with_gdal_options(dataset, dict(EEDA_BEARER='token'))
+                     .band.data.__dask_graph__())
+        functions = [task[0] for task in graph.values()
+                     if isinstance(task, tuple) and task and callable(task[0])]
+        reads = [function for function in functions if isinstance(function, partial)]
+        self.assertEqual(len(reads), 1, 'Expected the read task to be wrapped')
+        self.assertIs(reads[0].args[-1], fuse_lazy)
+        self.assertEqual(reads[0].args[0], dict(EEDA_BEARER='token'))
+        self.assertNotIn(fuse_lazy, functions, 'Expected no unwrapped read task')
+        self.assertIn(numpy.full, functions, 'Expected other tasks to be left as they are')
+
 if __name__ == '__main__':
     unittest.main()
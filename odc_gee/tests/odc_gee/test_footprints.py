@@ -0,0 +1,98 @@
+from datetime import timedelta
+import json
+import tempfile
+import unittest
+
+from odc_gee.footprints import FootprintCache, subtract
+
+PARENT = 'projects/earthengine-public/assets/LANDSAT/LC08/C01/T1_SR'
+
+def make_image(day, lon):
+    return dict(name=f'{PARENT}/image_{day}_{lon}', startTime=f'2020-01-{day:02d}T00:00:00Z',
+                geometry=dict(type='Polygon', coordinates=[[[lon, 0], [lon + 1, 0], [lon + 1, 1],
+                                                            [lon, 1], [lon, 0]]]))
+
+def make_region(xmin, xmax):
+    return json.dumps(dict(type='Polygon', coordinates=[[[xmin, 0], [xmax, 0], [xmax, 1],
+                                                         [xmin, 1], [xmin, 0]]]))
+
+class Collection:
+    ''' Lists images like the REST API, recording the queries made. '''
+    def __init__(self):
+        self.images = [make_image(day, lon) for day in range(1, 11) for lon in (0, 10, 20)]
+        self.queries = []
+
+    def __call__(self, parameters):
+        self.queries.append((parameters.get('startTime'), parameters.get('endTime')))
+        xmin, xmax = [json.loads(parameters['region'])['coordinates'][0][i][0] for i in (0, 1)]
+        return [image for image in self.images
+                if parameters.get('startTime', '') <= image['startTime']
+                < parameters.get('endTime', '9999')
+                and xmin <= image['geometry']['coordinates'][0][0][0] + 1
+                and image['geometry']['coordinates'][0][0][0] <= xmax]
+
+class FootprintCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.collection = Collection()
+
+    def list_images(self, start, end, xmin=-5, xmax=15):
+        cache = FootprintCache(self.path, latency=timedelta(0))
+        parameters = dict(parent=PARENT, region=make_region(xmin, xmax),
+                          startTime=f'2020-01-{start:02d}T00:00:00Z',
+                          endTime=f'2020-01-{end:02d}T00:00:00Z')
+        return [image['name'] for image in cache.list_images(parameters, self.collection)]
+
+    def test_subtract(self):
+        self.assertEqual(subtract((0, 10), [(2, 4), (3, 5), (8, 12)]), [(0, 2), (5, 8)])
+
+    def test_uncovered_ranges(self):
+        first = self.list_images(1, 5)
+        self.assertEqual(len(first), 8)
+        self.assertEqual(self.list_images(2, 4, xmin=0, xmax=5),
+                         [f'{PARENT}/image_2_0', f'{PARENT}/image_3_0'],
+                         'Expected a covered query to be answered from disk')
+        self.assertEqual(len(self.collection.queries), 1)
+        self.assertEqual(len(self.list_images(3, 8)), 10)
+        self.assertEqual(self.collection.queries[-1],
+                         ('2020-01-05T00:00:00.000Z', '2020-01-08T00:00:00.000Z'))
+        self.list_images(3, 8, xmin=5, xmax=25)
+        self.assertEqual(self.collection.queries[-1],
+                         ('2020-01-03T00:00:00.000Z', '2020-01-08T00:00:00.000Z'),
+                         'Expected a region outside the listed ones to be listed again')
+
+    def test_region_bounding_box(self):
+        cache = FootprintCache(self.path, latency=timedelta(0))
+        points = json.dumps(dict(type='MultiPoint', coordinates=[[0.5, 0], [20.5, 1]]))
+        parameters = dict(parent=PARENT, startTime='2020-01-01T00:00:00Z',
+                          endTime='2020-01-02T00:00:00Z')
+        self.assertEqual([image['name'] for image
+                          in cache.list_images(dict(parameters, region=points), self.collection)],
+                         [f'{PARENT}/image_1_0', f'{PARENT}/image_1_20'])
+        self.assertEqual([image['name'] for image
+                          in cache.list_images(dict(parameters, region=make_region(10.5, 11)),
+                                               self.collection)],
+                         [f'{PARENT}/image_1_10'],
+                         'Expected images between the points of a listed region to be indexed')
+        self.assertEqual(len(self.collection.queries), 1)
+
+    def test_merged_coverage(self):
+        self.list_images(1, 3)
+        self.list_images(3, 5)
+        self.list_images(2, 4)
+        index = FootprintCache(self.path).get(dict(parent=PARENT, region=make_region(-5, 15)))
+        self.assertEqual(len(index.gaps((-5, 0, 15, 1))), 2)
+        self.assertEqual(len(index._coverage), 1, 'Expected touching ranges to be merged')
+        self.assertEqual(len(self.list_images(1, 5)), 8)
+        self.assertEqual(len(self.collection.queries), 2)
+
+    def test_clear(self):
+        self.list_images(1, 5)
+        FootprintCache(self.path).clear()
+        self.assertEqual(len(self.list_images(1, 5)), 8)
+        self.assertEqual(len(self.collection.queries), 2, 'Expected a cleared cache to list again')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -41,5 +41,18 @@ class IndexerTestCase(unittest.TestCase):
             parsed_time = indexer.parse_time_parameter(asset=asset, time=time)
             self.assertEqual(parsed_time, expected)
 
+class ImageVersionTestCase(unittest.TestCase):
+    def test_image_version(self):
+        grid = dict(crsCode='EPSG:32618', dimensions=dict(width=7801, height=7901))
+        image = dict(name='image', bands=[dict(id='B1', grid=grid)])
+        self.assertEqual(indexing.image_version(dict(image, updateTime='2020-01-01T00:00:00Z')),
+                         '2020-01-01T00:00:00Z')
+        self.assertEqual(indexing.image_version(image),
+                         indexing.image_version(dict(image, bands=[dict(grid=grid, id='B1',
+                                                                        dataType={})])),
+                         'Expected the hash to only depend on band IDs and grids')
+        self.assertNotEqual(indexing.image_version(image),
+                            indexing.image_version(dict(image, bands=[dict(id='B2', grid=grid)])))
+
 if __name__ == '__main__':
     unittest.main()
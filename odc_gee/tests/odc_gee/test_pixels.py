@@ -0,0 +1,107 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+import io
+import json
+import unittest
+
+from affine import Affine
+import numpy
+
+from odc_gee.pixels import PixelReader
+from tests.odc_gee.helpers import TokenSession
+
+IMAGE = 'projects/earthengine-public/assets/LANDSAT/LC08/C01/T1_SR/LC08_166063_20200101'
+
+class PixelsHandler(BaseHTTPRequestHandler):
+    ''' Serves getPixels blocks whose values are the row and column of each pixel. '''
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        grid = body['grid']
+        rows = numpy.arange(grid['dimensions']['height'])[:, None]\
+               + int(grid['affineTransform']['translateY'])
+        cols = numpy.arange(grid['dimensions']['width'])[None, :]\
+               + int(grid['affineTransform']['translateX'])
+        block = numpy.zeros(rows.shape[0:1] + cols.shape[1:],
+                            dtype=[(band, 'i4') for band in body['bandIds']])
+        block['B2'] = rows * 1000 + cols
+        block['B3'] = -block['B2']
+        stream = io.BytesIO()
+        numpy.save(stream, block)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(stream.getvalue())
+
+    def log_message(self, *args):
+        pass
+
+class FootprintsHandler(BaseHTTPRequestHandler):
+    ''' Serves getPixels blocks of images valid in a range of columns and 0 outside it. '''
+    images = {'A': (1, 0, 30), 'B': (2, 20, 50)}
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        grid = body['grid']
+        value, start, stop = self.images[self.path.split(':')[0][-1]]
+        cols = numpy.arange(grid['dimensions']['width'])\
+               + int(grid['affineTransform']['translateX'])
+        block = numpy.zeros((grid['dimensions']['height'], len(cols)), dtype='i4')
+        block[:, (cols >= start) & (cols < stop)] = value
+        stream = io.BytesIO()
+        numpy.save(stream, block)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(stream.getvalue())
+
+    def log_message(self, *args):
+        pass
+
+class PixelReaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('localhost', 0), PixelsHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_read(self):
+        reader = PixelReader(TokenSession(), api_url=f'http://localhost:{self.server.server_port}',
+                             block_size=16, workers=4)
+        outputs = dict(blue=(numpy.full((1, 40, 50), -1, dtype='i4'), -1),
+                       green=(numpy.full((1, 40, 50), -1, dtype='i4'), -1))
+        paths = dict(blue=f'EEDAI:{IMAGE}:B2', green=f'EEDAI:{IMAGE}:B3')
+        reader.read([(0, [paths])], Affine(1, 0, 0, 0, 1, 0), 'EPSG:4326', outputs)
+        expected = numpy.arange(40)[:, None] * 1000 + numpy.arange(50)[None, :]
+        numpy.testing.assert_array_equal(outputs['blue'][0][0], expected)
+        numpy.testing.assert_array_equal(outputs['green'][0][0], -expected)
+
+    def test_sample(self):
+        reader = PixelReader(TokenSession(), api_url=f'http://localhost:{self.server.server_port}',
+                             block_size=16)
+        grid = dict(crsCode='EPSG:4326', affineTransform=dict(scaleX=1, scaleY=1))
+        values = reader.sample(IMAGE, ['B2', 'B3'], grid, numpy.array([5.5, 20.1, 6.5]),
+                               numpy.array([3.2, 2.9, 4.5]))
+        numpy.testing.assert_array_equal(values['B2'], [3005, 2020, 4006])
+        numpy.testing.assert_array_equal(values['B3'], [-3005, -2020, -4006])
+
+    def test_fuse(self):
+        server = HTTPServer(('localhost', 0), FootprintsHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        reader = PixelReader(TokenSession(), api_url=f'http://localhost:{server.server_port}',
+                             block_size=16)
+        def footprint(xmin, xmax):
+            return dict(type='Polygon', coordinates=[[[xmin, 0], [xmax, 0], [xmax, 40],
+                                                      [xmin, 40], [xmin, 0]]])
+        images = [(dict(blue=f'EEDAI:{IMAGE}A:B2'), footprint(0, 30)),
+                  (dict(blue=f'EEDAI:{IMAGE}B:B2'), footprint(20, 50))]
+        expected = numpy.where(numpy.arange(50) < 30, 1, 2)[None, :].repeat(40, axis=0)
+        for nodata in (-1, None):
+            outputs = dict(blue=(numpy.full((1, 40, 50), -1, dtype='i4'), nodata))
+            reader.read([(0, images)], Affine(1, 0, 0, 0, 1, 0), 'EPSG:4326', outputs)
+            numpy.testing.assert_array_equal(outputs['blue'][0][0], expected,
+                                             f'Expected the first valid pixel with nodata={nodata}')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import tempfile
+import unittest
+import uuid
+
+from odc_gee.snapshot import add_products, export_snapshot, read_snapshot
+
+PRODUCT = 'ls8_google'
+
+def make_dataset(day, lon):
+    ''' Makes a stand-in for an indexed datacube.model.Dataset. '''
+    time = datetime(2019 + day % 2, 1, day, tzinfo=timezone.utc)
+    doc = dict(id=str(uuid.uuid4()), product=dict(name=PRODUCT),
+               properties=dict(datetime=time.isoformat()),
+               geometry=dict(type='Polygon', coordinates=[[(lon, 0), (lon + 1, 0), (lon + 1, 1),
+                                                           (lon, 1), (lon, 0)]]))
+    return SimpleNamespace(id=doc['id'], metadata_doc=doc, center_time=time,
+                           uris=[f'EEDAI:projects/earthengine-public/assets/image_{day}'])
+
+class StandInIndex:
+    ''' An index holding one product and its datasets, standing in for datacube.index.Index. '''
+    def __init__(self, datasets=()):
+        self.added = []
+        definition = dict(name=PRODUCT, metadata_type='eo3')
+        self.products = SimpleNamespace(
+            get_by_name=lambda name: SimpleNamespace(definition=definition)\
+                                     if datasets and name == PRODUCT else None,
+            add_document=self.added.append)
+        self.datasets = SimpleNamespace(search=lambda **query: iter(datasets))
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.datasets = [make_dataset(day, lon) for (day, lon) in [(1, 10), (2, 20), (3, 30)]]
+        self.count = export_snapshot(StandInIndex(self.datasets), PRODUCT, self.path,
+                                     batch_size=1)
+
+    def test_export(self):
+        table = read_snapshot(self.path, columns=['id', 'product', 'year'])
+        self.assertEqual(self.count, 3)
+        self.assertEqual(sorted(table.column('id').to_pylist()),
+                         sorted(dataset.id for dataset in self.datasets))
+        self.assertEqual(set(table.column('year').to_pylist()), {2019, 2020})
+
+    def test_read_filters(self):
+        table = read_snapshot(self.path, columns=['uri'], product=PRODUCT,
+                              time=('2019-01-01', '2020-01-01T12:00'), bbox=(15, 0, 25, 1))
+        self.assertEqual(table.column('uri').to_pylist(),
+                         ['EEDAI:projects/earthengine-public/assets/image_2'])
+
+    def test_add_products(self):
+        index = StandInIndex()
+        self.assertEqual(add_products(index, self.path), [PRODUCT])
+        self.assertEqual(index.added, [dict(name=PRODUCT, metadata_type='eo3')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 from pathlib import Path
+import os
 import subprocess
 import unittest
 
@@ -34,5 +35,15 @@ class IndexGEETestCase(unittest.TestCase):
         self.assertGreater(len(datasets), 0,
                            'Expected to find datasets in index')
 
+class IndexGEEDryRunTestCase(unittest.TestCase):
+    def test_dry_run(self):
+        cmd = ["index_gee", "--product", "ls8_test", "--latitude", "(-4.15, -3.90)",
+               "--longitude", "(39.50, 39.75)", "--time", "2020-01", "--dry_run"]
+        env = dict(os.environ, GOOGLE_APPLICATION_CREDENTIALS='/nonexistent',
+                   DATACUBE_CONFIG_PATH='/nonexistent')
+        output = subprocess.check_output(cmd, env=env).decode()
+        self.assertIn('latitude=(-4.15, -3.9)', output,
+                      'Expected parsed latitude in dry run output')
+
 if __name__ == '__main__':
     unittest.main()